@@ -1,11 +1,56 @@
 import os
-import PyPDF2
-import together
-import gradio as gr
 import time
+_STARTUP_T0 = time.perf_counter()  # 콜드 스타트 시간 측정 기준 시각
 import uuid  # 고유 파일명 생성을 위해 추가
-from google.cloud import storage  # GCS 연동을 위해 추가
-import numpy as np
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, Future, FIRST_COMPLETED, wait, as_completed  # 단계 병렬 실행을 위해 추가
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from concurrent.futures.process import BrokenProcessPool
+import hashlib  # PDF 내용 기반 캐시 키 생성을 위해 추가
+import hmac
+import binascii
+import json
+import sqlite3  # 단계 결과 캐시를 디스크에 저장하기 위해 추가
+import threading
+import queue  # 백그라운드 GCS 업로드 대기열을 위해 추가
+import random
+import asyncio  # 공유 비동기 LLM 클라이언트의 이벤트 루프를 위해 추가
+import shutil
+import re
+import base64
+import io
+import tempfile
+from types import SimpleNamespace
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager, contextmanager
+
+# --- [신규] 콜드 스타트 시간 측정 ---
+# PyPDF2, together, google.cloud.storage는 처음 사용할 때 불러옵니다. 시작 시 불러오는 무거운 모듈은 gradio뿐입니다.
+# 단계별 소요 시간은 서버가 요청을 받을 준비가 되면 출력되고 /metrics에도 노출됩니다.
+STARTUP_BUDGET_SEC = float(os.getenv("STARTUP_BUDGET_SEC", "0"))
+startup_timings = {}
+
+@contextmanager
+def startup_phase(name: str):
+    """시작 과정의 한 단계를 측정해 startup_timings에 기록합니다."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        startup_timings[name] = time.perf_counter() - start
+
+def startup_report(total_label: str) -> str:
+    """측정된 시작 단계별 시간과 기준 시각부터의 총 시간을 표 형식 문자열로 반환합니다."""
+    startup_timings[total_label] = time.perf_counter() - _STARTUP_T0
+    lines = ["시작 시간 보고:"]
+    lines.extend(f"  {name:<24} {seconds:7.3f}s" for name, seconds in startup_timings.items())
+    if STARTUP_BUDGET_SEC:
+        status = "초과" if startup_timings[total_label] > STARTUP_BUDGET_SEC else "이내"
+        lines.append(f"  예산 {STARTUP_BUDGET_SEC:.3f}s {status}")
+    return "\n".join(lines)
+
+with startup_phase("import gradio"):
+    import gradio as gr
+_module_init_start = time.perf_counter()
 
 # --- 사전 설정 ---
 # Render 환경 변수에서 API 키를 안전하게 불러옵니다.
@@ -15,26 +60,186 @@ GCS_BUCKET_NAME = os.getenv("GCS_BUCKET_NAME")
 # Google Analytics 연동을 위한 설정
 GA_MEASUREMENT_ID = os.getenv("GA_MEASUREMENT_ID")
 
-if not api_key:
+# LLM 백엔드 선택: "together"(기본값) 또는 "mock"(API 없이 지연 시간/토큰 속도를 흉내 내는 로컬 백엔드)
+LLM_BACKEND = os.getenv("LLM_BACKEND", "together").lower()
+MOCK_LLM_LATENCY = float(os.getenv("MOCK_LLM_LATENCY", "0.5"))
+MOCK_LLM_TOKENS_PER_SEC = float(os.getenv("MOCK_LLM_TOKENS_PER_SEC", "50"))
+MOCK_LLM_REPLY_TOKENS = int(os.getenv("MOCK_LLM_REPLY_TOKENS", "200"))
+
+if not api_key and LLM_BACKEND == "together":
     print("오류: TOGETHER_API_KEY 환경 변수가 설정되지 않았습니다. 프로그램을 종료합니다.")
     exit() # API 키가 없으면 실행 중단
 
-# GCS 클라이언트는 한번만 초기화하는 것이 효율적입니다.
-storage_client = None
-if GCS_BUCKET_NAME:
-    try:
-        storage_client = storage.Client()
-    except Exception as e:
-        print(f"경고: Google Cloud Storage 클라이언트 초기화 실패. 파일이 저장되지 않습니다. 오류: {e}")
-else:
+# GCS 클라이언트는 첫 업로드 때 한 번만 초기화합니다 (get_gcs_uploader 참고).
+if not GCS_BUCKET_NAME:
     print("경고: GCS_BUCKET_NAME 환경 변수가 설정되지 않았습니다. 파일이 저장되지 않습니다.")
 
 
-try:
-    client = together.Together(api_key=api_key)
-except Exception as e:
-    print(f"오류: Together.ai 클라이언트 초기화에 실패했습니다. 에러: {e}")
-    exit()
+# --- [신규] 파이프라인 단계 병렬 실행 설정 ---
+# 서로 의존하지 않는 단계(PDF 추출, 1단계, 2단계, GCS 업로드)를 동시에 실행할 스레드 풀입니다.
+STAGE_WORKERS = int(os.getenv("STAGE_WORKERS", "16"))
+stage_executor = ThreadPoolExecutor(max_workers=STAGE_WORKERS, thread_name_prefix="stage")
+# 스트리밍 응답을 화면에 반영하는 최소 간격(초). 토큰마다 웹소켓으로 보내지 않도록 묶어서 전송합니다.
+STREAM_FLUSH_INTERVAL = float(os.getenv("STREAM_FLUSH_INTERVAL", "0.25"))
+
+# --- [신규] 멀티 워커 설정 ---
+# UVICORN_WORKERS가 2 이상이면 uvicorn이 여러 프로세스로 /api/batch와 /metrics만 제공하는 헤드리스 서버를 실행합니다.
+# 워커들이 하나의 소켓을 나눠 받아 Gradio 세션을 한 워커로 고정할 수 없으므로 이 모드에서는 Gradio UI를 띄우지 않습니다.
+# 이때 캐시, 호출 제한 상태, 접속자 수는 SHARED_STATE_DB(sqlite) 파일로 워커 간에 공유합니다.
+UVICORN_WORKERS = int(os.getenv("UVICORN_WORKERS", "1"))
+SHARED_STATE_DB = os.getenv("SHARED_STATE_DB") or (
+    os.path.join(tempfile.gettempdir(), "fasthire-shared.sqlite3") if UVICORN_WORKERS > 1 else None
+)
+# 공유 호출 제한기에서 슬롯을 기다릴 때 sqlite 상태를 다시 확인하는 간격(초)
+SHARED_LIMITER_POLL = float(os.getenv("SHARED_LIMITER_POLL", "0.05"))
+# 공유 호출 제한기의 sqlite 잠금 대기 시간(초). 넘으면 슬롯을 얻지 못한 것으로 보고 다시 확인합니다.
+SHARED_LIMITER_LOCK_TIMEOUT = float(os.getenv("SHARED_LIMITER_LOCK_TIMEOUT", "1"))
+# 슬롯 반납이 잠금 때문에 실패할 때 다시 시도하는 횟수입니다. 모두 실패하면 임대는 만료 시각에 정리됩니다.
+SHARED_LIMITER_RELEASE_ATTEMPTS = int(os.getenv("SHARED_LIMITER_RELEASE_ATTEMPTS", "20"))
+
+# --- [신규] 단계 결과 캐시 설정 ---
+# 1단계(회사/직무 정보)와 2단계(면접관 페르소나) 결과를 재사용하기 위한 캐시입니다.
+# STAGE_CACHE_PATH를 지정하면 sqlite 파일에 저장되어 재시작 후에도 유지됩니다.
+STAGE_CACHE_PATH = os.getenv("STAGE_CACHE_PATH")
+STAGE_CACHE_SIZE = int(os.getenv("STAGE_CACHE_SIZE", "2048"))
+STAGE_CACHE_TTL = float(os.getenv("STAGE_CACHE_TTL", str(24 * 60 * 60)))
+
+# --- [신규] 실행 체크포인트 설정 ---
+# 실행마다 단계 결과(압축된 이력서, 1~3단계 결과, 최종 출력)를 저장해 재시도 시 마지막 완료 단계부터 이어갑니다.
+# 이력서 내용이 포함되므로 개인정보 안내에 맞춰 짧게 보관하고 만료된 항목은 주기적으로 삭제합니다.
+# CHECKPOINT_PATH를 빈 문자열로 지정하면 메모리에만 저장하고, CHECKPOINT_ENABLED=0이면 저장하지 않습니다 (벤치마크 등).
+# 파일은 소유자만 읽을 수 있도록(0600) 만듭니다.
+CHECKPOINT_ENABLED = os.getenv("CHECKPOINT_ENABLED", "1").lower() not in ("0", "false", "no")
+CHECKPOINT_PATH = os.getenv("CHECKPOINT_PATH", os.path.join(tempfile.gettempdir(), "fasthire-checkpoints.sqlite3"))
+CHECKPOINT_SIZE = int(os.getenv("CHECKPOINT_SIZE", "1024"))
+CHECKPOINT_TTL = float(os.getenv("CHECKPOINT_TTL", str(60 * 60)))
+
+# --- [신규] PDF 추출 설정 ---
+# PDF 파싱은 CPU를 많이 사용하므로 별도 프로세스 풀에서 실행하고, 파일 내용(SHA-256) 기준으로 결과를 캐시합니다.
+PDF_WORKERS = int(os.getenv("PDF_WORKERS", "2"))
+PDF_CACHE_SIZE = int(os.getenv("PDF_CACHE_SIZE", "256"))
+# 페이지는 앞에서부터 하나씩 추출하고, 아래 한도 중 하나에 닿으면 멈춥니다. 프롬프트에는 어차피 앞부분만 들어갑니다.
+PDF_MAX_PAGES = int(os.getenv("PDF_MAX_PAGES", "20"))
+PDF_MAX_CHARS = int(os.getenv("PDF_MAX_CHARS", "60000"))
+PDF_TIME_LIMIT = float(os.getenv("PDF_TIME_LIMIT", "10"))
+# PDF_TIME_LIMIT는 페이지 사이에서만 확인되므로, 페이지 하나가 멈춰도 이 시간(초)이 지나면 추출 프로세스를 종료합니다.
+PDF_HARD_TIMEOUT = float(os.getenv("PDF_HARD_TIMEOUT", str(PDF_TIME_LIMIT + 5)))
+# 페이지 하나에서 가져오는 최대 글자 수 (압축 폭탄처럼 한 페이지에서 텍스트가 비정상적으로 많이 나오는 경우 대비)
+PDF_MAX_PAGE_CHARS = int(os.getenv("PDF_MAX_PAGE_CHARS", "20000"))
+# 비정상적인 파일은 파싱 전에 거부합니다: 파일 크기, 선언된 페이지 수, 페이지 하나의 콘텐츠 스트림 크기
+PDF_MAX_FILE_MB = float(os.getenv("PDF_MAX_FILE_MB", "20"))
+PDF_REJECT_PAGES = int(os.getenv("PDF_REJECT_PAGES", "1000"))
+PDF_MAX_STREAM_MB = float(os.getenv("PDF_MAX_STREAM_MB", "8"))
+
+# --- [신규] 백그라운드 GCS 업로드 설정 ---
+# 업로드는 요청 처리와 분리된 워커 스레드에서 수행됩니다. 대기열이 가득 차면
+# GCS_SPILL_DIR가 지정된 경우 디스크에 임시 보관하고, 아니면 업로드를 포기합니다. 재시도까지 실패한 업로드도 같은 방식으로 처리합니다.
+GCS_UPLOAD_WORKERS = int(os.getenv("GCS_UPLOAD_WORKERS", "2"))
+GCS_UPLOAD_QUEUE_SIZE = int(os.getenv("GCS_UPLOAD_QUEUE_SIZE", "100"))
+GCS_UPLOAD_RETRIES = int(os.getenv("GCS_UPLOAD_RETRIES", "3"))
+GCS_UPLOAD_BACKOFF = float(os.getenv("GCS_UPLOAD_BACKOFF", "1.0"))
+GCS_SPILL_DIR = os.getenv("GCS_SPILL_DIR")
+# 디스크에 보관된 파일은 이 횟수만큼 다시 업로드를 시도한 뒤에도 실패하면 GCS_DEAD_LETTER_DIR로 옮기고 더 시도하지 않습니다.
+GCS_SPILL_MAX_ATTEMPTS = int(os.getenv("GCS_SPILL_MAX_ATTEMPTS", "5"))
+GCS_DEAD_LETTER_DIR = os.getenv("GCS_DEAD_LETTER_DIR") or (os.path.join(GCS_SPILL_DIR, "dead-letter") if GCS_SPILL_DIR else None)
+# 보관 파일과 dead-letter 파일은 이력서이므로 소유자만 읽을 수 있게(0600) 쓰고, dead-letter 파일은 이 시간(초)이 지나면 삭제합니다.
+GCS_DEAD_LETTER_TTL = float(os.getenv("GCS_DEAD_LETTER_TTL", str(24 * 60 * 60)))
+# 업로드할 PDF 내용은 대기열에 bytes로 두지 않고 이 디렉터리의 파일로 옮긴 뒤 경로만 대기열에 넣습니다.
+GCS_STAGING_DIR = os.getenv("GCS_STAGING_DIR", os.path.join(tempfile.gettempdir(), "fasthire-gcs-staging"))
+
+# --- [신규] 업로드 파일 관리 설정 ---
+# 업로드된 PDF는 Gradio 캐시 파일에서 업로드 저장소로 복사합니다. Gradio 캐시 파일은 UPLOAD_TTL이 지나면
+# Gradio가 GRADIO_CACHE_CLEANUP_INTERVAL(초)마다 지우고, UPLOAD_MAX_MB를 넘는 파일은 디스크에 쓰기 전에 거부됩니다.
+# 작은 파일은 메모리에, 큰 파일은 UPLOAD_DIR에 보관하며, 세션이 종료되거나 UPLOAD_TTL이 지나면 삭제합니다.
+# 생성이 끝나도 지우지 않으므로 같은 파일로 입력만 바꿔 다시 생성할 수 있습니다.
+UPLOAD_DIR = os.getenv("UPLOAD_DIR", os.path.join(tempfile.gettempdir(), "fasthire-uploads"))
+UPLOAD_MAX_MB = float(os.getenv("UPLOAD_MAX_MB", str(PDF_MAX_FILE_MB)))
+UPLOAD_SPOOL_MAX_KB = int(os.getenv("UPLOAD_SPOOL_MAX_KB", "512"))
+# 전체 업로드가 차지할 수 있는 메모리/디스크 용량. 넘으면 가장 오래 사용되지 않은 파일부터 삭제합니다.
+UPLOAD_MEMORY_QUOTA_MB = float(os.getenv("UPLOAD_MEMORY_QUOTA_MB", "64"))
+UPLOAD_DISK_QUOTA_MB = float(os.getenv("UPLOAD_DISK_QUOTA_MB", "1024"))
+UPLOAD_TTL = float(os.getenv("UPLOAD_TTL", str(60 * 60)))
+GRADIO_CACHE_CLEANUP_INTERVAL = int(os.getenv("GRADIO_CACHE_CLEANUP_INTERVAL", "600"))
+
+# --- [신규] 이력서 압축 설정 ---
+# 3단계 프롬프트에 들어가는 이력서 본문의 최대 토큰 수(추정치)입니다.
+RESUME_TOKEN_BUDGET = int(os.getenv("RESUME_TOKEN_BUDGET", "3000"))
+
+# --- [신규] 결과 정리 방식 설정 ---
+# "llm": 기존처럼 Llama 모델로 결과를 정리합니다.
+# "local": 문자(한글/영문) 판별과 섹션 파싱으로 서버에서 바로 정리하고, 파싱에 실패할 때만 LLM을 호출합니다.
+SUMMARY_MODE = os.getenv("SUMMARY_MODE", "llm").lower()
+
+# --- [신규] 구조화된(JSON) 출력 설정 ---
+# "1"이면 2단계(페르소나)와 3단계(질문)가 JSON 스키마에 맞춘 응답을 요청합니다. 스트리밍 중에도 완성된 질문부터 바로 표시하고,
+# 응답을 파싱해 실패를 정확히 판별하며, 결과를 서버에서 바로 구성하므로 결과 정리(요약) 단계를 건너뜁니다.
+# 사용하는 모델이 JSON 스키마 출력(response_format)을 지원해야 합니다.
+STRUCTURED_OUTPUT = os.getenv("STRUCTURED_OUTPUT", "0") != "0"
+
+# --- [신규] 3단계 면접관별 분할 설정 ---
+# 2단계 페르소나를 면접관별로 나누어 면접관마다 3단계 호출을 동시에 보냅니다 ("0"이면 기존처럼 한 번에 호출).
+# 소요 시간이 면접관 수에 비례하지 않으므로 입력 슬라이더의 최대값을 늘릴 수 있습니다.
+STEP3_FANOUT = os.getenv("STEP3_FANOUT", "1") != "0"
+MAX_INTERVIEWERS = int(os.getenv("MAX_INTERVIEWERS", "5"))
+MAX_QUESTIONS_PER_INTERVIEWER = int(os.getenv("MAX_QUESTIONS_PER_INTERVIEWER", "5"))
+
+# --- [신규] 1, 2단계 미리 실행 설정 ---
+# 사용자가 회사명/직무명/면접관 수를 입력하고 PDF를 올리는 동안 1, 2단계를 미리 실행해 단계 결과 캐시에 넣어 둡니다.
+# 입력이 PREFETCH_DELAY초 동안 바뀌지 않으면 시작하며, 호출 제한에 걸려 기다려야 하는 경우에는 실행하지 않습니다.
+PREFETCH_ENABLED = os.getenv("PREFETCH_ENABLED", "1") != "0"
+PREFETCH_DELAY = float(os.getenv("PREFETCH_DELAY", "1.5"))
+PREFETCH_WORKERS = int(os.getenv("PREFETCH_WORKERS", "4"))
+
+# --- [신규] LLM 호출 제한 설정 ---
+# Together.ai 속도 제한에 걸리지 않도록 모델별로 동시 요청 수와 초당 요청 수를 제한합니다. 모든 세션이 공유합니다.
+# LLM_RATE_PER_SEC가 0 이하이면 초당 요청 수는 제한하지 않고 동시 요청 수만 제한합니다.
+LLM_MAX_IN_FLIGHT = int(os.getenv("LLM_MAX_IN_FLIGHT", "8"))
+LLM_RATE_PER_SEC = float(os.getenv("LLM_RATE_PER_SEC", "4"))
+LLM_BURST = int(os.getenv("LLM_BURST", "8"))
+# --- [신규] 공유 비동기 LLM 클라이언트 설정 ---
+# 켜져 있으면 모든 세션이 하나의 AsyncTogether 클라이언트와 keep-alive 연결 풀을 공유합니다. 끄면 동기 클라이언트를 사용합니다.
+LLM_ASYNC_CLIENT = os.getenv("LLM_ASYNC_CLIENT", "1").lower() not in ("0", "false", "no")
+# 연결 풀 크기. 파이프라인이 두 모델(exaone-deep-32b, Llama-3.3-70B)을 함께 쓰므로 기본값은 모델별 동시 요청 한도의 두 배입니다.
+LLM_POOL_SIZE = int(os.getenv("LLM_POOL_SIZE", str(LLM_MAX_IN_FLIGHT * 2)))
+# 쉬는 연결을 닫기 전까지 유지하는 시간(초)입니다.
+LLM_POOL_KEEPALIVE = float(os.getenv("LLM_POOL_KEEPALIVE", "120"))
+# 서버 시작 직후 미리 열어 둘 연결 수. 0이면 워밍업 요청을 보내지 않습니다.
+LLM_WARMUP_CONNECTIONS = int(os.getenv("LLM_WARMUP_CONNECTIONS", "2"))
+# Gradio 대기열 설정. 동시에 실행되는 생성 요청 수를 LLM 동시 요청 한도에 맞춥니다.
+GENERATE_CONCURRENCY = int(os.getenv("GENERATE_CONCURRENCY", str(LLM_MAX_IN_FLIGHT)))
+GRADIO_QUEUE_SIZE = int(os.getenv("GRADIO_QUEUE_SIZE", "256"))
+
+# --- [신규] LLM 재시도/헤징/대체 모델 설정 ---
+# 일시적인 오류(429/5xx, 연결 오류)는 지터를 넣은 지수 백오프로 재시도하고, 그래도 실패하면 대체 모델(Llama)로 전환합니다.
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "2"))
+LLM_RETRY_BACKOFF = float(os.getenv("LLM_RETRY_BACKOFF", "1.0"))
+# 응답이 이 시간(초) 안에 오지 않으면 같은 요청을 한 번 더 보내 먼저 온 응답을 사용합니다. 0이면 사용하지 않습니다.
+LLM_HEDGE_AFTER = float(os.getenv("LLM_HEDGE_AFTER", "0"))
+# 취소된 요청(헤징에서 진 요청 등)을 알아차리기 위해 진행 중인 비동기 요청 상태를 확인하는 간격(초)
+LLM_CANCEL_POLL = float(os.getenv("LLM_CANCEL_POLL", "0.05"))
+# generate_interview_questions 한 번의 실행에 허용되는 전체 시간(초)입니다.
+RUN_DEADLINE = float(os.getenv("RUN_DEADLINE", "300"))
+
+# --- [신규] 헤드리스 배치 처리 설정 ---
+# 배치 작업을 동시에 처리할 워커 수입니다. 동시 LLM 호출은 별도로 호출 제한기의 통제를 받습니다.
+BATCH_WORKERS = int(os.getenv("BATCH_WORKERS", "4"))
+# 설정된 경우에만 POST /api/batch 엔드포인트를 열고, Authorization: Bearer <토큰> 헤더를 요구합니다.
+BATCH_API_TOKEN = os.getenv("BATCH_API_TOKEN")
+# /api/batch 요청 본문의 최대 크기(MB). 본문은 메모리에 읽으므로 넘으면 읽기를 멈추고 413으로 거부합니다.
+BATCH_MAX_BODY_MB = float(os.getenv("BATCH_MAX_BODY_MB", "64"))
+
+# --- [신규] 3단계 스트리밍 실행 풀 ---
+# 면접관별 3단계 스트림은 동시에 실행되는 생성 요청(UI + 배치) 수 × 최대 면접관 수만큼 필요합니다.
+# 스레드가 모자라면 호출이 스레드 풀 안에서 기다리는데, 그 대기는 호출 제한기의 대기 순번 안내와 기한(deadline)
+# 밖에 있으므로 풀을 충분히 크게 잡아 대기가 호출 제한기에서만 일어나게 합니다. 스레드는 필요할 때만 만들어집니다.
+STEP3_WORKERS = int(os.getenv("STEP3_WORKERS", str((GENERATE_CONCURRENCY + BATCH_WORKERS) * MAX_INTERVIEWERS)))
+step3_executor = ThreadPoolExecutor(max_workers=STEP3_WORKERS, thread_name_prefix="step3")
+
+# --- [신규] 실시간 접속자 수 설정 ---
+# 접속자 수는 서버에서 주기적으로 한 번만 계산하고, 언어별 HTML을 미리 만들어 둡니다.
+LIVE_USERS_REFRESH_SEC = float(os.getenv("LIVE_USERS_REFRESH_SEC", "10"))
+# 브라우저가 표시 값을 새로 받아 가는 주기(초). 0이면 접속/언어 변경 시에만 갱신합니다.
+LIVE_USERS_POLL_SEC = float(os.getenv("LIVE_USERS_POLL_SEC", "30"))
 
 # --- [신규] LLM 모델 정의 ---
 MODELS = {
@@ -45,6 +250,8 @@ LLAMA_MODEL_ID = {
     'ko': 'meta-llama/Llama-3.3-70B-Instruct-Turbo-Free',
     'en': 'meta-llama/Llama-3.3-70B-Instruct-Turbo-Free' 
 }
+# 기본 모델 호출이 재시도 후에도 실패하면 사용할 대체 모델입니다.
+FALLBACK_MODELS = {MODELS[lang]: LLAMA_MODEL_ID[lang] for lang in MODELS}
 
 # --- [신규] 다국어 지원을 위한 텍스트 관리 ---
 LANG_STRINGS = {
@@ -67,6 +274,12 @@ LANG_STRINGS = {
         "contact_html": """<div style='display: flex; justify-content: space-between; align-items: flex-start; color: gray; font-size: 0.9em; margin-top: 40px; margin-bottom: 30px;'><div style='text-align: left; max-width: 70%;'>회사명, 직무명, PDF 이력서를 기반으로 <strong>다양한 면접관한테 면접 질문을</strong> 받을 수 있습니다.<br>맞춤형 <strong>면접 준비</strong>, <strong>자기소개서 기반 질문</strong>, <strong>다양한 형태의 질문 대비</strong>, <strong>취업 대비</strong>까지 완벽하게 지원합니다.</div><div style='text-align: right; white-space: nowrap;'>Contact us: eeooeeforbiz@gmail.com</div></div>""",
         "error_all_fields": "회사명, 직무명, PDF 파일을 모두 입력해주세요.",
         "error_not_pdf": "❌ 오류: PDF 파일만 업로드할 수 있습니다.",
+        "error_upload_too_large": "❌ 오류: 파일이 너무 큽니다. {max_mb:g}MB 이하의 PDF를 업로드해 주세요.",
+        "error_upload_expired": "❌ 업로드한 파일이 만료되었습니다. PDF를 다시 업로드해 주세요.",
+        "error_upload_failed": "❌ 오류: 파일을 저장하지 못했습니다. PDF를 다시 업로드해 주세요.",
+        "log_pdf_truncated": "ℹ️ 이력서가 길어 앞부분 {pages_read}/{total_pages}페이지({reason})만 사용합니다.\n",
+        "pdf_truncate_reasons": {"pages": "페이지 수 한도", "chars": "글자 수 한도", "time": "처리 시간 한도", "stream": "지나치게 큰 페이지"},
+        "log_resumed": "♻️ 이전 실행에서 완료된 단계는 저장된 결과를 사용합니다.\n",
         "log_step1_start": "➡️ 1단계: 회사 및 직무 정보 분석 중...",
         "log_step1_fail": "❌ 1단계 실패: ",
         "log_step1_done": "✅ 1단계 완료.\n\n",
@@ -79,18 +292,26 @@ LANG_STRINGS = {
         "log_summary_start": "➡️ 추가 단계: 생성된 결과 요약 중...",
         "log_summary_fail": "결과를 요약하는 데 실패했습니다.",
         "log_all_done": "✅ 모든 작업이 완료되었습니다!\n\n---\n\n",
+        "log_queue_position": "⏳ 요청이 많아 대기 중입니다... (대기 순번: {position})",
         "live_users": "실시간 접속자 수: {user_count}",
         "final_result_header": "### 🌟 면접관 프로필 + 면접 질문 + 질문 의도",
-        "prompt_context": """{company_name}의 {job_title} 채용에 대한 [면접 상황]을 아래 양식에 맞게 사실에 기반하여 한글로 작성해 주세요.
+        "structured_personas_header": "[면접관 페르소나]",
+        "structured_questions_header": "[면접 질문]",
+        "structured_persona_labels": {"name_gender": "이름/성별", "age_range": "연령대", "position": "소속 및 직책",
+                                      "experience": "경력", "personality": "성격 및 태도", "interview_style": "면접 스타일"},
+        "structured_intent_label": "의도",
+        "prompt_context": """사용자가 알려주는 회사와 직무의 채용에 대한 [면접 상황]을 아래 양식에 맞게 사실에 기반하여 한글로 작성해 주세요.
 
 [면접 상황]
-- 회사명: {company_name}
+- 회사명: (사용자가 알려준 회사명)
 - 회사 소개: (회사의 비전, 문화, 주력 사업 등을 간략히 서술)
-- 채용 직무: {job_title}
+- 채용 직무: (사용자가 알려준 채용 직무)
 - 핵심 요구 역량: (해당 직무에 필요한 기술 스택, 소프트 스킬 등을 3-4가지 서술)""",
+        "prompt_context_input": """회사명: {company_name}
+채용 직무: {job_title}""",
         
         
-        "prompt_personas": """{company_name}의 {job_title} 직무 면접관 {num_interviewers}명의 페르소나를 아래 형식으로, 반드시 한글을 사용해서 생성해 주세요. 각 페르소나는 직책, 경력, 성격, 주요 질문 스타일이 드러나도록 구체적으로 묘사해야 합니다.
+        "prompt_personas": """사용자가 알려주는 회사와 직무의 면접관 페르소나를 사용자가 요청한 인원수만큼 아래 형식으로, 반드시 한글을 사용해서 생성해 주세요. 각 페르소나는 직책, 경력, 성격, 주요 질문 스타일이 드러나도록 구체적으로 묘사해야 합니다.
 
 (면접관 페르소나 형식)
 *   **이름/성별:** (이름/성별) (예: 김민준/남성, 박서연/여성)
@@ -99,15 +320,36 @@ LANG_STRINGS = {
 *   **경력:** (관련 분야 경력) (예: 15년차 개발자, 5년차 HR 담당자)
 *   **성격 및 태도:** (성격 및 태도) (예: 꼼꼼하고 분석적이며, 데이터 기반의 답변을 선호함. 온화하고 친근하며, 지원자의 경험에 깊이 공감하려 노력함)
 *   **면접 스타일:** (면접 스타일) (예: 직무 역량 중심의 압박 질문, 경험 기반의 행동사례면접(BEI), 편안한 대화 형식의 커피챗 스타일)""",
+        "prompt_personas_json": """사용자가 알려주는 회사와 직무의 면접관 페르소나를 사용자가 요청한 인원수만큼, 반드시 한글을 사용해서 생성해 주세요. 각 페르소나는 직책, 경력, 성격, 주요 질문 스타일이 드러나도록 구체적으로 묘사해야 합니다.
 
-
-        
-        "prompt_final": """당신은 지금부터 면접 질문 생성 AI입니다. 아래 주어진 [면접 정보]를 완벽하게 숙지하고, 최고의 면접 질문을 한글로 만들어야 합니다.
+응답은 아래 형식의 JSON 객체 하나로만 출력해 주세요.
+{"personas": [{"name": "이름 (예: 김민준)", "gender": "성별 (예: 남성)", "age_range": "연령대 (예: 30대 초반)", "position": "소속 부서 및 직책 (예: 기술 개발팀 팀장)", "experience": "관련 분야 경력 (예: 15년차 개발자)", "personality": "성격 및 태도 (예: 꼼꼼하고 분석적이며, 데이터 기반의 답변을 선호함)", "interview_style": "면접 스타일 (예: 경험 기반의 행동사례면접(BEI))"}]}""",
+        "prompt_personas_input": """회사명: {company_name}
+채용 직무: {job_title}
+면접관 수: {num_interviewers}명""",
 
 
+        
+        "prompt_final": """당신은 지금부터 면접 질문 생성 AI입니다. 사용자가 주는 [면접 정보]를 완벽하게 숙지하고, 최고의 면접 질문을 한글로 만들어야 합니다.
 
+[수행 과제]
+[면접 정보]에 기반하여, 각 면접관의 역할과 스타일에 맞는 맞춤형 면접 질문을 면접관별로 [면접 정보]의 '4. 면접관별 질문 개수'만큼 반드시 한글로 생성해 주세요.
+- (지원자 정보)의 활동과 관련된 질문을 반드시 1개 이상 포함해야 합니다.
+- 면접관 별로 '면접관 페르소나'에 따라 질문에 개성이 확실히 드러나야합니다.
+- (회사 명) 에 관한 정보를 알고 있다면, 해당 회사의 정보를 활용한 질문을 만들어주세요. (회사 명) 정보가 없으면 만들지 마세요.
+- 질문 뒤에는 "(의도: ...)" 형식으로 질문의 핵심 의도를 간략히 덧붙여 주세요.
+- 최종 결과물은 면접관별로 구분하여 깔끔하게 정리된 형태로만 출력해 주세요.""",
+        "prompt_final_json": """당신은 지금부터 면접 질문 생성 AI입니다. 사용자가 주는 [면접 정보]를 완벽하게 숙지하고, 최고의 면접 질문을 한글로 만들어야 합니다.
 
-[면접 정보]
+[수행 과제]
+[면접 정보]에 기반하여, 각 면접관의 역할과 스타일에 맞는 맞춤형 면접 질문을 면접관별로 [면접 정보]의 '4. 면접관별 질문 개수'만큼 반드시 한글로 생성해 주세요.
+- (지원자 정보)의 활동과 관련된 질문을 반드시 1개 이상 포함해야 합니다.
+- 면접관 별로 '면접관 페르소나'에 따라 질문에 개성이 확실히 드러나야합니다.
+- (회사 명) 에 관한 정보를 알고 있다면, 해당 회사의 정보를 활용한 질문을 만들어주세요. (회사 명) 정보가 없으면 만들지 마세요.
+- 질문마다 질문의 핵심 의도를 intent에 간략히 적어 주세요.
+- 응답은 아래 형식의 JSON 객체 하나로만 출력해 주세요. 면접관마다 interviewers 항목을 하나씩 만들고, name에는 페르소나의 이름을 적습니다.
+{"interviewers": [{"name": "면접관 이름", "questions": [{"question": "면접 질문", "intent": "질문 의도"}]}]}""",
+        "prompt_final_input": """[면접 정보]
 1. 면접 상황
 {context_info}
 
@@ -117,19 +359,11 @@ LANG_STRINGS = {
 3. 지원자 정보 (자기소개서/포트폴리오 원문)
 {resume_text}
 
-[수행 과제]
-위 [면접 정보]에 기반하여, 각 면접관의 역할과 스타일에 맞는 맞춤형 면접 질문을 면접관별로 {questions_per_interviewer}개씩 반드시 한글로 생성해 주세요.
-- (지원자 정보)의 활동과 관련된 질문을 반드시 1개 이상 포함해야 합니다.
-- 면접관 별로 '면접관 페르소나'에 따라 질문에 개성이 확실히 드러나야합니다.
-- (회사 명) 에 관한 정보를 알고 있다면, 해당 회사의 정보를 활용한 질문을 만들어주세요. (회사 명) 정보가 없으면 만들지 마세요.
-- 질문 뒤에는 "(의도: ...)" 형식으로 질문의 핵심 의도를 간략히 덧붙여 주세요.
-- 최종 결과물은 면접관별로 구분하여 깔끔하게 정리된 형태로만 출력해 주세요.""",
+4. 면접관별 질문 개수
+{questions_per_interviewer}개""",
         
-        "prompt_real_final": """
-        
-아래 내용에서 영어 위주 문장을 지우고 한글위주 문장만 남겨주세요
-
-내용:
+        "prompt_real_final": """사용자가 주는 내용에서 영어 위주 문장을 지우고 한글위주 문장만 남겨주세요""",
+        "prompt_real_final_input": """내용:
 {full_content_to_summarize}
 """,
     },
@@ -152,6 +386,12 @@ LANG_STRINGS = {
         "contact_html": """<div style='display: flex; justify-content: space-between; align-items: flex-start; color: gray; font-size: 0.9em; margin-top: 40px; margin-bottom: 30px;'><div style='text-align: left; max-width: 70%;'>Get <strong>interview questions from various interviewers</strong> based on company name, job title, and your PDF resume.<br>We provide complete support from tailored <strong>interview preparation</strong>, <strong>resume-based questions</strong>, preparing for <strong>various question types</strong>, to <strong>job search readiness</strong>.</div><div style='text-align: right; white-space: nowrap;'>Contact us: eeooeeforbiz@gmail.com</div></div>""",
         "error_all_fields": "Please enter the company name, job title, and upload a PDF file.",
         "error_not_pdf": "❌ Error: Only PDF files can be uploaded.",
+        "error_upload_too_large": "❌ Error: The file is too large. Please upload a PDF of {max_mb:g}MB or less.",
+        "error_upload_expired": "❌ The uploaded file has expired. Please upload the PDF again.",
+        "error_upload_failed": "❌ Error: The file could not be saved. Please upload the PDF again.",
+        "log_pdf_truncated": "ℹ️ The resume is long, so only the first {pages_read}/{total_pages} pages are used ({reason}).\n",
+        "pdf_truncate_reasons": {"pages": "page limit", "chars": "character limit", "time": "time limit", "stream": "oversized page"},
+        "log_resumed": "♻️ Reusing saved results for steps completed in a previous run.\n",
         "log_step1_start": "➡️ Step 1: Analyzing company and job information...",
         "log_step1_fail": "❌ Step 1 Failed: ",
         "log_step1_done": "✅ Step 1 Complete.\n\n",
@@ -164,16 +404,25 @@ LANG_STRINGS = {
         "log_summary_start": "➡️ Extra Step: Summarizing the generated results...",
         "log_summary_fail": "Failed to summarize the results.",
         "log_all_done": "✅ All tasks are complete!\n\n---\n\n",
+        "log_queue_position": "⏳ High demand, waiting in queue... (position: {position})",
         "live_users": "Live Users: {user_count}",
         "final_result_header": "### 🌟 Interviewer Profiles + Interview Questions + Question Intent",
-        "prompt_context": """Please create a detailed [Interview Scenario] for the {job_title} position at {company_name}, based on facts, in the format below.
+        "structured_personas_header": "[Interviewer Personas]",
+        "structured_questions_header": "[Interview Questions]",
+        "structured_persona_labels": {"name_gender": "Name/Gender", "age_range": "Age Range", "position": "Department/Title",
+                                      "experience": "Professional Experience", "personality": "Personality & Approach",
+                                      "interview_style": "Interview Style"},
+        "structured_intent_label": "Intent",
+        "prompt_context": """Please create a detailed [Interview Scenario] for the position and company given by the user, based on facts, in the format below.
 
 [Interview Scenario]
-- Company Name: {company_name}
+- Company Name: (Company name given by the user)
 - Company Introduction: (Briefly describe the company's vision, culture, and main business)
-- Hiring Position: {job_title}
+- Hiring Position: (Position given by the user)
 - Key Required Competencies: (List 3-4 technical skills and soft skills required for the position)""",
-        "prompt_personas": """Please create {num_interviewers} interviewer personas for the {job_title} position at {company_name}. Each persona should be described in detail, including their job title, career background, personality, and primary questioning style.
+        "prompt_context_input": """Company Name: {company_name}
+Hiring Position: {job_title}""",
+        "prompt_personas": """Please create as many interviewer personas as the user requests for the position and company given by the user. Each persona should be described in detail, including their job title, career background, personality, and primary questioning style.
 
 [Persona Creation Example]
 (Interviewer Persona Format)
@@ -189,11 +438,31 @@ Professional Experience: (Relevant Professional Experience) (e.g., 15-year veter
 Personality & Approach: (Personality & Attitude) (e.g., Detail-oriented and analytical, prefers data-driven responses. Warm and approachable, strives to deeply empathize with candidates’ experiences.)
 
 Interview Style: (Interview Style) (e.g., Competency-based rigorous questions, Behavioral Event Interview (BEI), Relaxed conversational “coffee chat” style)""",
+        "prompt_personas_json": """Please create as many interviewer personas as the user requests for the position and company given by the user. Each persona should be described in detail, including their job title, career background, personality, and primary questioning style.
+
+Respond with a single JSON object in the format below.
+{"personas": [{"name": "Name (e.g., Michael Kim)", "gender": "Gender (e.g., Male)", "age_range": "Age range (e.g., Early 30s)", "position": "Department & position (e.g., Engineering Team Lead)", "experience": "Relevant professional experience (e.g., 15-year veteran developer)", "personality": "Personality & attitude (e.g., Detail-oriented and analytical, prefers data-driven responses)", "interview_style": "Interview style (e.g., Behavioral Event Interview (BEI))"}]}""",
+        "prompt_personas_input": """Company Name: {company_name}
+Hiring Position: {job_title}
+Number of Interviewers: {num_interviewers}""",
         
 
-        "prompt_final": """You are now an interview question generation AI. You must perfectly understand the [Interview Information] provided below and create the best interview questions.
+        "prompt_final": """You are now an interview question generation AI. You must perfectly understand the [Interview Information] provided by the user and create the best interview questions.
 
-[Interview Information]
+[Task to Perform]
+Based on the [Interview Information], generate tailored interview questions for each interviewer, matching their role and style. The number of questions per interviewer is given in '4. Questions per Interviewer' of the [Interview Information].
+- You must include at least one question related to the activities mentioned in the (Applicant Information).
+- After each question, briefly add the core intent of the question in the format "(Intent: ...)."
+- The final output should be presented in a neatly organized format, separated by interviewer.""",
+        "prompt_final_json": """You are now an interview question generation AI. You must perfectly understand the [Interview Information] provided by the user and create the best interview questions.
+
+[Task to Perform]
+Based on the [Interview Information], generate tailored interview questions for each interviewer, matching their role and style. The number of questions per interviewer is given in '4. Questions per Interviewer' of the [Interview Information].
+- You must include at least one question related to the activities mentioned in the (Applicant Information).
+- Briefly state the core intent of each question in its intent field.
+- Respond with a single JSON object in the format below. Add one interviewers entry per interviewer and put the persona's name in name.
+{"interviewers": [{"name": "Interviewer name", "questions": [{"question": "Interview question", "intent": "Question intent"}]}]}""",
+        "prompt_final_input": """[Interview Information]
 1. Interview Scenario
 {context_info}
 
@@ -203,13 +472,10 @@ Interview Style: (Interview Style) (e.g., Competency-based rigorous questions, B
 3. Applicant Information (Original text from resume/portfolio)
 {resume_text}
 
-[Task to Perform]
-Based on the [Interview Information] above, generate {questions_per_interviewer} tailored interview questions for each interviewer, matching their role and style.
-- You must include at least one question related to the activities mentioned in the (Applicant Information).
-- After each question, briefly add the core intent of the question in the format "(Intent: ...)."
-- The final output should be presented in a neatly organized format, separated by interviewer.""",
-        "prompt_real_final": """Please remove any redundant information from the text below and leave only the 'Interviewer Personas' and 'Interview Questions'.
----
+4. Questions per Interviewer
+{questions_per_interviewer}""",
+        "prompt_real_final": """Please remove any redundant information from the text given by the user and leave only the 'Interviewer Personas' and 'Interview Questions'.""",
+        "prompt_real_final_input": """---
 {full_content_to_summarize}
 ---""",
     }
@@ -251,6 +517,1178 @@ if GA_MEASUREMENT_ID:
 else:
     print("경고: GA_MEASUREMENT_ID 환경 변수가 설정되지 않아 Google Analytics가 비활성화되었습니다.")
 
+# --- [신규] Prometheus 형식 지표 ---
+class Counter:
+    """라벨별로 값을 누적하는 Prometheus 형식 카운터입니다."""
+
+    def __init__(self, name: str, documentation: str):
+        self.name = name
+        self.documentation = documentation
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_format_labels(dict(key))} {value}")
+        return lines
+
+class Histogram:
+    """라벨별로 관측값의 분포(누적 버킷, 합계, 개수)를 기록하는 Prometheus 형식 히스토그램입니다."""
+
+    def __init__(self, name: str, documentation: str, buckets: tuple):
+        self.name = name
+        self.documentation = documentation
+        self.buckets = buckets
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            counts, total, count = self._values.get(key, ([0] * len(self.buckets), 0.0, 0))
+            counts = [bucket_count + (value <= bound) for bucket_count, bound in zip(counts, self.buckets)]
+            self._values[key] = (counts, total + value, count + 1)
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for key, (counts, total, count) in sorted(self._values.items()):
+                labels = dict(key)
+                for bound, bucket_count in zip(self.buckets, counts):
+                    lines.append(f"{self.name}_bucket{_format_labels(dict(labels, le=str(float(bound))))} {bucket_count}")
+                lines.append(f"{self.name}_bucket{_format_labels(dict(labels, le='+Inf'))} {count}")
+                lines.append(f"{self.name}_sum{_format_labels(labels)} {total}")
+                lines.append(f"{self.name}_count{_format_labels(labels)} {count}")
+        return lines
+
+def _format_labels(labels: dict) -> str:
+    """라벨 dict를 {name="value",...} 형식으로 변환합니다."""
+    if not labels:
+        return ""
+    pairs = []
+    for name, value in sorted(labels.items()):
+        value = str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+        pairs.append(f'{name}="{value}"')
+    return "{" + ",".join(pairs) + "}"
+
+def _render_samples(name: str, metric_type: str, documentation: str, samples: list) -> list:
+    """(라벨, 값) 목록을 Prometheus 텍스트 형식으로 변환합니다. 기존 통계 dict를 지표로 내보낼 때 사용합니다."""
+    lines = [f"# HELP {name} {documentation}", f"# TYPE {name} {metric_type}"]
+    lines.extend(f"{name}{_format_labels(labels)} {value}" for labels, value in samples)
+    return lines
+
+stage_duration_seconds = Histogram(
+    "fasthire_stage_duration_seconds",
+    "Pipeline stage duration in seconds",
+    (0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 40, 80, 160),
+)
+llm_tokens_total = Counter("fasthire_llm_tokens_total", "LLM token usage reported by the provider")
+
+# 단계 함수가 실행되는 스레드에 현재 단계 라벨을 기록해 두고, 토큰 사용량을 같은 라벨로 집계합니다.
+_stage_context = threading.local()
+
+def current_stage_labels() -> dict:
+    """현재 스레드에서 실행 중인 단계의 라벨(stage, lang 등)을 반환합니다."""
+    return dict(getattr(_stage_context, "labels", {"stage": "-"}))
+
+def record_token_usage(model: str, labels: dict, usage):
+    """response.usage(또는 같은 키를 가진 dict)의 토큰 수를 모델/단계/언어 라벨로 기록합니다."""
+    if usage is None:
+        return
+    for token_type in ("prompt_tokens", "completion_tokens"):
+        value = usage.get(token_type) if isinstance(usage, dict) else getattr(usage, token_type, None)
+        if value:
+            llm_tokens_total.inc(
+                value,
+                model=model,
+                stage=labels.get("stage", "-"),
+                lang=labels.get("lang", "-"),
+                type=token_type.replace("_tokens", ""),
+            )
+
+# --- [신규] 단계 결과 캐시 ---
+def connect_shared_db(path: str, timeout: float = 30) -> sqlite3.Connection:
+    """여러 스레드와 워커 프로세스가 함께 쓰는 sqlite 연결을 엽니다 (WAL 모드, 기본 잠금 대기 30초)."""
+    # 캐시와 체크포인트에는 이력서 내용이 들어가므로 소유자만 읽고 쓸 수 있게 만듭니다.
+    # sqlite는 -wal, -shm 파일을 DB 파일과 같은 권한으로 만듭니다.
+    os.close(os.open(path, os.O_RDWR | os.O_CREAT, 0o600))
+    for suffix in ("", "-wal", "-shm"):
+        try:
+            os.chmod(path + suffix, 0o600)
+        except OSError:
+            pass
+    conn = sqlite3.connect(path, timeout=timeout, check_same_thread=False)
+    conn.execute("PRAGMA journal_mode=WAL")
+    return conn
+
+def make_cache_key(*parts) -> str:
+    """공백과 대소문자 차이를 정규화하여 캐시 키를 만듭니다."""
+    return "\x1f".join(" ".join(str(part).split()).casefold() for part in parts)
+
+class StageCache:
+    """크기(LRU)와 TTL 기준으로 항목을 제거하는 메모리 캐시입니다."""
+
+    def __init__(self, max_size: int, ttl: float):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._data = OrderedDict()
+
+    def get(self, key: str):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None and time.time() - entry[0] > self.ttl:
+                del self._data[key]
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def set(self, key: str, value):
+        with self._lock:
+            self._data[key] = (time.time(), value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+
+    def __len__(self):
+        with self._lock:
+            return len(self._data)
+
+    def purge_expired(self):
+        """TTL이 지난 항목을 모두 삭제합니다."""
+        cutoff = time.time() - self.ttl
+        with self._lock:
+            for key in [key for key, entry in self._data.items() if entry[0] < cutoff]:
+                del self._data[key]
+
+    def stats(self) -> dict:
+        return {"hits": self.hits, "misses": self.misses, "size": len(self)}
+
+class SqliteStageCache(StageCache):
+    """sqlite 파일에 저장되어 재시작 후에도 유지되는 캐시입니다. 값은 JSON으로 직렬화합니다."""
+
+    def __init__(self, path: str, max_size: int, ttl: float, table: str = "stage_cache"):
+        super().__init__(max_size, ttl)
+        self.table = table
+        self._conn = connect_shared_db(path)
+        self._conn.execute(
+            f"CREATE TABLE IF NOT EXISTS {self.table} ("
+            "key TEXT PRIMARY KEY, value TEXT NOT NULL, created REAL NOT NULL, accessed REAL NOT NULL)"
+        )
+        self._conn.commit()
+
+    def get(self, key: str):
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                f"SELECT value, created FROM {self.table} WHERE key = ?", (key,)
+            ).fetchone()
+            if row is not None and now - row[1] > self.ttl:
+                self._conn.execute(f"DELETE FROM {self.table} WHERE key = ?", (key,))
+                self._conn.commit()
+                row = None
+            if row is None:
+                self.misses += 1
+                return None
+            self._conn.execute(f"UPDATE {self.table} SET accessed = ? WHERE key = ?", (now, key))
+            self._conn.commit()
+            self.hits += 1
+            return json.loads(row[0])
+
+    def set(self, key: str, value):
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                f"INSERT OR REPLACE INTO {self.table} (key, value, created, accessed) VALUES (?, ?, ?, ?)",
+                (key, json.dumps(value, ensure_ascii=False), now, now),
+            )
+            self._conn.execute(f"DELETE FROM {self.table} WHERE created < ?", (now - self.ttl,))
+            self._conn.execute(
+                f"DELETE FROM {self.table} WHERE key NOT IN "
+                f"(SELECT key FROM {self.table} ORDER BY accessed DESC LIMIT ?)",
+                (self.max_size,),
+            )
+            self._conn.commit()
+
+    def __len__(self):
+        with self._lock:
+            return self._conn.execute(f"SELECT COUNT(*) FROM {self.table}").fetchone()[0]
+
+    def purge_expired(self):
+        with self._lock:
+            self._conn.execute(f"DELETE FROM {self.table} WHERE created < ?", (time.time() - self.ttl,))
+            self._conn.commit()
+
+if STAGE_CACHE_PATH or SHARED_STATE_DB:
+    stage_cache = SqliteStageCache(STAGE_CACHE_PATH or SHARED_STATE_DB, STAGE_CACHE_SIZE, STAGE_CACHE_TTL)
+else:
+    stage_cache = StageCache(STAGE_CACHE_SIZE, STAGE_CACHE_TTL)
+
+# 같은 이력서를 다른 직무로 다시 제출하는 경우가 많아 추출 결과를 보관합니다 (멀티 워커 모드에서는 워커 간 공유).
+if SHARED_STATE_DB:
+    pdf_cache = SqliteStageCache(SHARED_STATE_DB, PDF_CACHE_SIZE, STAGE_CACHE_TTL, table="pdf_cache")
+else:
+    pdf_cache = StageCache(PDF_CACHE_SIZE, STAGE_CACHE_TTL)
+
+# --- [신규] 실행 체크포인트 ---
+if not CHECKPOINT_ENABLED:
+    # 크기 0인 캐시는 저장하자마자 항목을 버리므로 체크포인트가 꺼집니다.
+    checkpoint_store = StageCache(0, CHECKPOINT_TTL)
+elif CHECKPOINT_PATH:
+    checkpoint_store = SqliteStageCache(CHECKPOINT_PATH, CHECKPOINT_SIZE, CHECKPOINT_TTL, table="run_checkpoints")
+else:
+    checkpoint_store = StageCache(CHECKPOINT_SIZE, CHECKPOINT_TTL)
+_checkpoint_lock = threading.Lock()
+
+def make_run_id(*parts) -> str:
+    """입력값(정규화)과 PDF 내용 해시로 실행 id를 만듭니다. 같은 요청은 같은 id를 갖습니다."""
+    return hashlib.sha256(make_cache_key(*parts).encode("utf-8")).hexdigest()
+
+def save_checkpoint(run_id: str, **stages):
+    """완료된 단계 결과를 실행 체크포인트에 추가합니다."""
+    with _checkpoint_lock:
+        checkpoint = checkpoint_store.get(run_id) or {}
+        checkpoint.update(stages)
+        checkpoint_store.set(run_id, checkpoint)
+
+def _checkpoint_janitor():
+    # 요청이 없어도 만료된 체크포인트가 남아 있지 않도록 주기적으로 삭제합니다.
+    while True:
+        time.sleep(min(CHECKPOINT_TTL, 300))
+        try:
+            checkpoint_store.purge_expired()
+        except Exception as e:
+            print(f"체크포인트 정리 실패: {e}")
+
+threading.Thread(target=_checkpoint_janitor, name="checkpoint-janitor", daemon=True).start()
+
+# --- [신규] 백그라운드 GCS 업로드 ---
+class BackgroundUploader:
+    """제한된 크기의 대기열과 워커 스레드로 GCS 업로드를 수행합니다.
+    client는 bucket(name).blob(name).upload_from_filename(path) / upload_from_string(data) 형태만 지원하면 되므로
+    로컬 테스트에서는 가짜 스토리지 클라이언트를 넣을 수 있습니다. 업로드 대상은 파일 경로 또는 bytes입니다.
+    bytes는 staging_dir의 파일로 옮긴 뒤 경로만 대기열에 넣으므로, 대기열이 길어져도 PDF 내용이 메모리에 쌓이지 않습니다."""
+
+    def __init__(self, client, bucket_name: str, workers: int = 2, queue_size: int = 100,
+                 max_retries: int = 3, backoff: float = 1.0, spill_dir: str = None, staging_dir: str = None,
+                 spill_max_attempts: int = 5, dead_letter_dir: str = None, dead_letter_ttl: float = 24 * 60 * 60):
+        self.client = client
+        self.bucket_name = bucket_name
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.spill_dir = spill_dir
+        self.spill_max_attempts = max(1, spill_max_attempts)
+        self.dead_letter_dir = dead_letter_dir or (os.path.join(spill_dir, "dead-letter") if spill_dir else None)
+        self.dead_letter_ttl = dead_letter_ttl
+        self._next_dead_letter_purge = 0.0
+        self.staging_dir = staging_dir or os.path.join(tempfile.gettempdir(), "fasthire-gcs-staging")
+        os.makedirs(self.staging_dir, mode=0o700, exist_ok=True)
+        self.stats = {"queued": 0, "uploaded": 0, "retried": 0, "failed": 0, "dropped": 0, "spilled": 0, "dead_lettered": 0, "dead_letter_expired": 0}
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._lock = threading.Lock()
+        self._spill_in_progress = set()
+        # 보관 파일 이름별 재업로드 시도 횟수
+        self._spill_attempts = {}
+        if spill_dir:
+            os.makedirs(spill_dir, mode=0o700, exist_ok=True)
+            os.makedirs(self.dead_letter_dir, mode=0o700, exist_ok=True)
+            self._purge_dead_letters()
+        for i in range(workers):
+            threading.Thread(target=self._worker, name=f"gcs-uploader-{i}", daemon=True).start()
+
+    def submit(self, source_file_path, destination_blob_name: str) -> bool:
+        """업로드를 대기열에 넣고 즉시 반환합니다. 대기열이 가득 차면 디스크에 보관하거나 버립니다."""
+        if self._queue.full():
+            return self._spill(source_file_path, destination_blob_name, "업로드 대기열이 가득 찼습니다")
+        kind = "caller"
+        if isinstance(source_file_path, bytes):
+            staged_path = os.path.join(self.staging_dir, uuid.uuid4().hex)
+            try:
+                with open(os.open(staged_path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600), "wb") as file:
+                    file.write(source_file_path)
+            except OSError as e:
+                print(f"GCS 업로드 파일을 준비하지 못했습니다: {e}")
+                self._count("dropped")
+                return False
+            source_file_path, kind = staged_path, "staged"
+        try:
+            self._queue.put_nowait((source_file_path, destination_blob_name, kind))
+            self._count("queued")
+            return True
+        except queue.Full:
+            spilled = self._spill(source_file_path, destination_blob_name, "업로드 대기열이 가득 찼습니다")
+            if kind == "staged":
+                os.remove(source_file_path)
+            return spilled
+
+    def join(self):
+        """대기열에 들어간 업로드가 모두 끝날 때까지 기다립니다."""
+        self._queue.join()
+
+    def _count(self, name: str):
+        with self._lock:
+            self.stats[name] += 1
+
+    def _spill(self, source_file_path, destination_blob_name: str, reason: str) -> bool:
+        """지금 업로드할 수 없는 파일을 spill_dir에 보관합니다. reason은 보관하지 못할 때 로그에 남길 이유입니다."""
+        if not self.spill_dir:
+            print(f"GCS 업로드를 건너뜁니다 ('{destination_blob_name}'): {reason}")
+            self._count("dropped")
+            return False
+        try:
+            fd = os.open(os.path.join(self.spill_dir, destination_blob_name), os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+            # 이미 있던 파일을 덮어쓸 때도 권한을 0600으로 맞춥니다.
+            os.fchmod(fd, 0o600)
+            with open(fd, "wb") as file:
+                if isinstance(source_file_path, bytes):
+                    file.write(source_file_path)
+                else:
+                    with open(source_file_path, "rb") as source:
+                        shutil.copyfileobj(source, file)
+            self._count("spilled")
+            return True
+        except OSError as e:
+            print(f"GCS 업로드 파일을 디스크에 보관하지 못했습니다: {e}")
+            self._count("dropped")
+            return False
+
+    def _requeue_spilled(self):
+        """대기열이 비었을 때 디스크에 보관된 파일을 다시 대기열에 넣습니다."""
+        if not self.spill_dir:
+            return
+        with self._lock:
+            names = [name for name in os.listdir(self.spill_dir)
+                     if name not in self._spill_in_progress and os.path.isfile(os.path.join(self.spill_dir, name))]
+            for name in names:
+                try:
+                    self._queue.put_nowait((os.path.join(self.spill_dir, name), name, "spilled"))
+                except queue.Full:
+                    break
+                self._spill_in_progress.add(name)
+
+    def _worker(self):
+        while True:
+            try:
+                source_file_path, destination_blob_name, kind = self._queue.get(timeout=5)
+            except queue.Empty:
+                self._requeue_spilled()
+                self._purge_dead_letters()
+                continue
+            try:
+                error = self._upload_with_retry(source_file_path, destination_blob_name)
+                if kind == "spilled":
+                    self._finish_spilled(source_file_path, destination_blob_name, error)
+                else:
+                    if error is not None:
+                        # 재시도까지 실패한 파일은 디스크에 보관해 두었다가 나중에 다시 시도합니다.
+                        self._spill(source_file_path, destination_blob_name, f"재시도 후에도 업로드 실패: {error}")
+                    if kind == "staged":
+                        os.remove(source_file_path)
+            except Exception as e:
+                print(f"GCS 업로드 워커 오류: {e}")
+            finally:
+                self._queue.task_done()
+
+    def _finish_spilled(self, path: str, name: str, error):
+        """보관 파일의 재업로드 결과를 처리합니다. 계속 실패하는 파일은 dead_letter_dir로 옮겨 다시 시도하지 않습니다."""
+        with self._lock:
+            self._spill_in_progress.discard(name)
+            attempts = self._spill_attempts.pop(name, 0) + 1
+            if error is not None and attempts < self.spill_max_attempts:
+                self._spill_attempts[name] = attempts
+        if error is None:
+            os.remove(path)
+        elif attempts >= self.spill_max_attempts:
+            print(f"보관된 '{name}' 업로드가 {attempts}회 실패해 '{self.dead_letter_dir}'(으)로 옮깁니다. 마지막 오류: {error}")
+            dead_letter_path = os.path.join(self.dead_letter_dir, name)
+            os.replace(path, dead_letter_path)
+            # 보관 기간은 dead-letter로 옮긴 시점부터 셉니다.
+            os.utime(dead_letter_path)
+            self._count("dead_lettered")
+        else:
+            print(f"보관된 '{name}' 업로드 실패 ({attempts}/{self.spill_max_attempts}회), 나중에 다시 시도합니다: {error}")
+
+    def _purge_dead_letters(self):
+        """dead_letter_ttl이 지난 dead-letter 파일을 삭제합니다. 1분에 한 번만 확인합니다."""
+        if not self.dead_letter_dir:
+            return
+        with self._lock:
+            # 여러 워커가 동시에 삭제하지 않도록 확인 시각은 잠금 안에서 정합니다.
+            if time.monotonic() < self._next_dead_letter_purge:
+                return
+            self._next_dead_letter_purge = time.monotonic() + 60
+        cutoff = time.time() - self.dead_letter_ttl
+        try:
+            entries = list(os.scandir(self.dead_letter_dir))
+        except OSError as e:
+            print(f"dead-letter 디렉터리를 확인하지 못했습니다: {e}")
+            return
+        for entry in entries:
+            try:
+                if entry.is_file() and entry.stat().st_mtime < cutoff:
+                    os.remove(entry.path)
+                    self._count("dead_letter_expired")
+            except OSError as e:
+                print(f"만료된 dead-letter 파일 '{entry.name}'을(를) 삭제하지 못했습니다: {e}")
+
+    def _upload_with_retry(self, source_file_path, destination_blob_name: str):
+        """업로드에 성공하면 None을, 재시도까지 모두 실패하면 마지막 예외를 반환합니다."""
+        last_error = None
+        for attempt in range(self.max_retries + 1):
+            try:
+                start = time.perf_counter()
+                bucket = self.client.bucket(self.bucket_name)
+                blob = bucket.blob(destination_blob_name)
+                if isinstance(source_file_path, bytes):
+                    blob.upload_from_string(source_file_path, content_type="application/pdf")
+                else:
+                    blob.upload_from_filename(source_file_path)
+                stage_duration_seconds.observe(time.perf_counter() - start, stage="gcs_upload", lang="-", model="-")
+                print(f"파일을 버킷 '{self.bucket_name}'에 '{destination_blob_name}'(으)로 업로드했습니다.")
+                self._count("uploaded")
+                return None
+            except Exception as e:
+                last_error = e
+                print(f"GCS 업로드 중 오류 발생 (시도 {attempt + 1}/{self.max_retries + 1}): {e}")
+                if attempt < self.max_retries:
+                    self._count("retried")
+                    time.sleep(self.backoff * (2 ** attempt) * random.uniform(0.5, 1.5))
+        self._count("failed")
+        return last_error
+
+gcs_uploader = None
+_gcs_uploader_lock = threading.Lock()
+_gcs_uploader_failed = False
+
+def get_gcs_uploader():
+    """GCS 클라이언트와 백그라운드 업로더를 처음 사용할 때 생성합니다. 초기화에 실패하면 None을 반환합니다."""
+    global gcs_uploader, _gcs_uploader_failed
+    with _gcs_uploader_lock:
+        if gcs_uploader is None and GCS_BUCKET_NAME and not _gcs_uploader_failed:
+            try:
+                from google.cloud import storage  # GCS 연동을 위해 추가 (첫 업로드 때 불러옵니다)
+                storage_client = storage.Client()
+            except Exception as e:
+                print(f"경고: Google Cloud Storage 클라이언트 초기화 실패. 파일이 저장되지 않습니다. 오류: {e}")
+                _gcs_uploader_failed = True
+                return None
+            gcs_uploader = BackgroundUploader(
+                storage_client,
+                GCS_BUCKET_NAME,
+                workers=GCS_UPLOAD_WORKERS,
+                queue_size=GCS_UPLOAD_QUEUE_SIZE,
+                max_retries=GCS_UPLOAD_RETRIES,
+                backoff=GCS_UPLOAD_BACKOFF,
+                spill_dir=GCS_SPILL_DIR,
+                staging_dir=GCS_STAGING_DIR,
+                spill_max_attempts=GCS_SPILL_MAX_ATTEMPTS,
+                dead_letter_dir=GCS_DEAD_LETTER_DIR,
+                dead_letter_ttl=GCS_DEAD_LETTER_TTL,
+            )
+        return gcs_uploader
+
+# --- [신규] 업로드 파일 저장소 ---
+def _process_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+class UploadStore:
+    """업로드된 PDF를 세션별로 보관합니다. 작은 파일은 메모리에, 큰 파일은 디스크에 두고
+    메모리/디스크 용량 한도를 넘으면 가장 오래 사용되지 않은(LRU) 파일부터 삭제합니다."""
+
+    def __init__(self, directory: str, max_bytes: int, spool_max_bytes: int, memory_quota: int, disk_quota: int, ttl: float):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.spool_max_bytes = spool_max_bytes
+        self.quotas = {"memory": memory_quota, "disk": disk_quota}
+        self.ttl = ttl
+        self.stats = {"stored": 0, "rejected": 0, "deleted": 0, "evicted": 0, "expired": 0}
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        # 워커 프로세스마다 하위 디렉터리를 씁니다. 종료된 프로세스가 남긴 파일은 개인정보이므로 시작할 때 지웁니다.
+        os.makedirs(directory, mode=0o700, exist_ok=True)
+        for name in os.listdir(directory):
+            if not name.isdigit() or not _process_alive(int(name)):
+                shutil.rmtree(os.path.join(directory, name), ignore_errors=True)
+        self.directory = os.path.join(directory, str(os.getpid()))
+        os.makedirs(self.directory, mode=0o700, exist_ok=True)
+
+    def add(self, source_path: str, name: str, session_hash: str = None) -> str:
+        """파일을 저장소로 복사하고 업로드 id를 반환합니다. 같은 세션의 이전 업로드는 삭제합니다.
+        파일이 max_bytes보다 크면 ValueError를 발생시킵니다."""
+        size = os.path.getsize(source_path)
+        if size > self.max_bytes:
+            with self._lock:
+                self.stats["rejected"] += 1
+            raise ValueError(f"upload is too large ({size} bytes)")
+        with open(source_path, "rb") as file:
+            data = file.read()
+        upload_id = uuid.uuid4().hex
+        entry = SimpleNamespace(
+            name=name, size=size, digest=hashlib.sha256(data).hexdigest(), session_hash=session_hash,
+            created=time.time(), storage="memory", data=data, path=None,
+        )
+        if size > self.spool_max_bytes:
+            entry.storage, entry.data, entry.path = "disk", None, os.path.join(self.directory, upload_id)
+            with open(os.open(entry.path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600), "wb") as file:
+                file.write(data)
+        with self._lock:
+            if session_hash:
+                for old_id in [key for key, old in self._entries.items() if old.session_hash == session_hash]:
+                    self._delete(old_id, "deleted")
+            self._entries[upload_id] = entry
+            self.stats["stored"] += 1
+            self._evict(entry.storage, keep=upload_id)
+        return upload_id
+
+    def get(self, upload_id: str):
+        """업로드 정보(name, size, digest)와 read()를 가진 객체를 반환합니다. 없거나 만료되었으면 None입니다."""
+        with self._lock:
+            entry = self._entries.get(upload_id)
+            if entry is None:
+                return None
+            if time.time() - entry.created > self.ttl:
+                self._delete(upload_id, "expired")
+                return None
+            self._entries.move_to_end(upload_id)
+        return SimpleNamespace(name=entry.name, size=entry.size, digest=entry.digest, read=lambda: self._read(entry))
+
+    def _read(self, entry) -> bytes:
+        if entry.data is not None:
+            return entry.data
+        try:
+            with open(entry.path, "rb") as file:
+                return file.read()
+        except FileNotFoundError:
+            return None
+
+    def remove(self, upload_id: str):
+        with self._lock:
+            self._delete(upload_id, "deleted")
+
+    def remove_session(self, session_hash: str):
+        with self._lock:
+            for upload_id in [key for key, entry in self._entries.items() if entry.session_hash == session_hash]:
+                self._delete(upload_id, "deleted")
+
+    def purge_expired(self):
+        cutoff = time.time() - self.ttl
+        with self._lock:
+            for upload_id in [key for key, entry in self._entries.items() if entry.created < cutoff]:
+                self._delete(upload_id, "expired")
+
+    def bytes_held(self) -> dict:
+        with self._lock:
+            held = {"memory": 0, "disk": 0}
+            for entry in self._entries.values():
+                held[entry.storage] += entry.size
+            return held
+
+    def files_held(self) -> dict:
+        with self._lock:
+            held = {"memory": 0, "disk": 0}
+            for entry in self._entries.values():
+                held[entry.storage] += 1
+            return held
+
+    def _delete(self, upload_id: str, reason: str):
+        # 호출하는 쪽에서 _lock을 잡고 있어야 합니다.
+        entry = self._entries.pop(upload_id, None)
+        if entry is None:
+            return
+        if entry.path:
+            try:
+                os.remove(entry.path)
+            except FileNotFoundError:
+                pass
+        self.stats[reason] += 1
+
+    def _evict(self, storage: str, keep: str):
+        # 호출하는 쪽에서 _lock을 잡고 있어야 합니다.
+        held = sum(entry.size for entry in self._entries.values() if entry.storage == storage)
+        for upload_id in [key for key, entry in self._entries.items() if entry.storage == storage and key != keep]:
+            if held <= self.quotas[storage]:
+                break
+            held -= self._entries[upload_id].size
+            self._delete(upload_id, "evicted")
+
+upload_store = UploadStore(
+    UPLOAD_DIR,
+    max_bytes=int(UPLOAD_MAX_MB * 1024 * 1024),
+    spool_max_bytes=UPLOAD_SPOOL_MAX_KB * 1024,
+    memory_quota=int(UPLOAD_MEMORY_QUOTA_MB * 1024 * 1024),
+    disk_quota=int(UPLOAD_DISK_QUOTA_MB * 1024 * 1024),
+    ttl=UPLOAD_TTL,
+)
+
+def _upload_janitor():
+    # 세션 종료 이벤트를 놓친 업로드도 UPLOAD_TTL이 지나면 삭제합니다.
+    while True:
+        time.sleep(min(UPLOAD_TTL, 60))
+        try:
+            upload_store.purge_expired()
+        except Exception as e:
+            print(f"업로드 파일 정리 실패: {e}")
+
+threading.Thread(target=_upload_janitor, name="upload-janitor", daemon=True).start()
+
+# --- [신규] LLM 백엔드 ---
+def _response_format_args(response_format: dict) -> dict:
+    """response_format이 있을 때만 API 호출 인자에 넣습니다 (지원하지 않는 모델에 빈 값을 보내지 않도록)."""
+    return {"response_format": response_format} if response_format else {}
+
+class TogetherBackend:
+    """Together.ai SDK를 사용하는 기본 LLM 백엔드입니다.
+    client에는 chat.completions.create를 지원하는 객체(테스트용 가짜 클라이언트 포함)를 넣을 수 있습니다."""
+
+    def __init__(self, client):
+        self.client = client
+
+    def complete(self, model: str, messages: list, on_usage=None, response_format: dict = None, cancel=None) -> str:
+        """응답 전체를 받아 텍스트를 반환합니다. 빈 응답이면 빈 문자열을 반환합니다.
+        on_usage가 주어지면 response.usage(토큰 사용량)를 전달합니다. response_format은 JSON 스키마 출력 요청에 사용합니다.
+        동기 클라이언트는 보낸 요청을 중간에 끊을 수 없으므로 cancel(threading.Event)은 요청을 보내기 전에만 확인합니다."""
+        if cancel is not None and cancel.is_set():
+            raise CallCancelled("LLM call cancelled before it was sent")
+        response = self.client.chat.completions.create(
+            model=model,
+            messages=messages,
+            **_response_format_args(response_format),
+        )
+        if on_usage:
+            on_usage(getattr(response, "usage", None))
+        if response.choices and response.choices[0].message.content:
+            return response.choices[0].message.content.strip()
+        return ""
+
+    def stream(self, model: str, messages: list, on_usage=None, response_format: dict = None, deadline: float = None):
+        """응답을 토큰 단위로 받아 새로 도착한 텍스트 조각을 차례로 내보냅니다.
+        토큰 사용량은 보통 마지막 청크에 포함되며, on_usage가 주어지면 전달합니다.
+        deadline이 있으면 남은 시간을 요청 타임아웃으로 넘겨, 응답이 멈춘 스트림이 그 이상 기다리지 않게 합니다."""
+        remaining = _remaining(deadline)
+        response = self.client.chat.completions.create(
+            model=model,
+            messages=messages,
+            stream=True,
+            **_response_format_args(response_format),
+            **({"timeout": max(remaining, 0.001)} if remaining is not None else {}),
+        )
+        for chunk in response:
+            usage = getattr(chunk, "usage", None)
+            if usage and on_usage:
+                on_usage(usage)
+            if not chunk.choices:
+                continue
+            delta = chunk.choices[0].delta.content
+            if delta:
+                yield delta
+
+class AsyncTogetherBackend:
+    """모든 세션이 공유하는 AsyncTogether 클라이언트로 호출하는 LLM 백엔드입니다.
+    전용 스레드의 이벤트 루프에서 요청을 보내므로 작업 스레드가 각자 동기 HTTP 연결을 붙잡지 않고,
+    크기가 정해진 keep-alive 연결 풀을 재사용합니다. 풀이 가득 차면 빈 연결이 생길 때까지 기다리며,
+    사용 중/대기 중인 요청 수와 대기 시간을 기록해 풀 크기를 조정할 수 있게 합니다.
+    client에는 AsyncTogether와 같은 인터페이스의 객체(테스트용 가짜 클라이언트 포함)를 넣을 수 있습니다."""
+
+    def __init__(self, client, pool_size: int):
+        self.client = client
+        self.pool_size = max(1, pool_size)
+        self.in_use = 0
+        self.waiting = 0
+        self.stats = {"requests": 0, "waited": 0}
+        self._loop = asyncio.new_event_loop()
+        threading.Thread(target=self._loop.run_forever, name="llm-async-loop", daemon=True).start()
+        # 세마포어는 이벤트 루프 안에서 만들어야 합니다.
+        self._slots = asyncio.run_coroutine_threadsafe(self._create_slots(), self._loop).result()
+
+    async def _create_slots(self):
+        return asyncio.Semaphore(self.pool_size)
+
+    @asynccontextmanager
+    async def _connection(self):
+        """연결 풀 자리를 하나 차지합니다. 자리가 없어 기다린 시간은 stage="llm_pool_wait"로 기록합니다."""
+        self.stats["requests"] += 1
+        if self._slots.locked():
+            self.stats["waited"] += 1
+            self.waiting += 1
+            start = time.perf_counter()
+            try:
+                await self._slots.acquire()
+            finally:
+                self.waiting -= 1
+            stage_duration_seconds.observe(time.perf_counter() - start, stage="llm_pool_wait", lang="-", model="-")
+        else:
+            await self._slots.acquire()
+        self.in_use += 1
+        try:
+            yield
+        finally:
+            self.in_use -= 1
+            self._slots.release()
+
+    async def _complete(self, model: str, messages: list, response_format: dict):
+        async with self._connection():
+            return await self.client.chat.completions.create(
+                model=model, messages=messages, **_response_format_args(response_format)
+            )
+
+    def complete(self, model: str, messages: list, on_usage=None, response_format: dict = None, cancel=None) -> str:
+        """응답 전체를 받아 텍스트를 반환합니다. 빈 응답이면 빈 문자열을 반환합니다.
+        cancel(threading.Event)이 설정되면 진행 중인 요청을 취소하고 CallCancelled를 발생시킵니다."""
+        future = asyncio.run_coroutine_threadsafe(self._complete(model, messages, response_format), self._loop)
+        try:
+            while True:
+                try:
+                    response = future.result(timeout=None if cancel is None else LLM_CANCEL_POLL)
+                    break
+                except FutureTimeoutError:
+                    if cancel.is_set():
+                        raise CallCancelled("LLM call cancelled while in flight")
+        except BaseException:
+            future.cancel()
+            raise
+        if on_usage:
+            on_usage(getattr(response, "usage", None))
+        if response.choices and response.choices[0].message.content:
+            return response.choices[0].message.content.strip()
+        return ""
+
+    async def _stream(self, model: str, messages: list, chunks: queue.Queue, response_format: dict):
+        """응답 청크를 chunks에 넣습니다. 끝나면 None을, 실패하면 예외 객체를 넣습니다."""
+        try:
+            async with self._connection():
+                response = await self.client.chat.completions.create(
+                    model=model, messages=messages, stream=True, **_response_format_args(response_format)
+                )
+                try:
+                    async for chunk in response:
+                        chunks.put(chunk)
+                finally:
+                    # 소비자가 중간에 멈춰도 연결을 풀에 돌려줍니다.
+                    close = getattr(response, "close", None)
+                    if close:
+                        await close()
+            chunks.put(None)
+        except asyncio.CancelledError:
+            chunks.put(None)
+            raise
+        except Exception as e:
+            chunks.put(e)
+
+    def stream(self, model: str, messages: list, on_usage=None, response_format: dict = None, deadline: float = None):
+        """이벤트 루프에서 받은 청크를 호출한 스레드로 넘겨 새로 도착한 텍스트 조각을 차례로 내보냅니다.
+        deadline까지 다음 청크가 오지 않으면 DeadlineExceeded를 발생시키며,
+        제너레이터가 중간에 닫히면(기한 초과 등) 진행 중인 요청을 취소합니다."""
+        chunks = queue.Queue()
+        future = asyncio.run_coroutine_threadsafe(self._stream(model, messages, chunks, response_format), self._loop)
+        try:
+            while True:
+                try:
+                    chunk = chunks.get(timeout=_remaining(deadline))
+                except queue.Empty:
+                    raise DeadlineExceeded("deadline exceeded while streaming the LLM response")
+                if chunk is None:
+                    return
+                if isinstance(chunk, Exception):
+                    raise chunk
+                usage = getattr(chunk, "usage", None)
+                if usage and on_usage:
+                    on_usage(usage)
+                if not chunk.choices:
+                    continue
+                delta = chunk.choices[0].delta.content
+                if delta:
+                    yield delta
+        finally:
+            future.cancel()
+
+    def warm_up(self, connections: int) -> float:
+        """가벼운 모델 목록 요청을 동시에 보내 TLS/연결 설정을 미리 끝내 두고, 걸린 시간(초)을 반환합니다."""
+        async def open_connections():
+            async def touch():
+                async with self._connection():
+                    await self.client.models.list()
+            await asyncio.gather(*(touch() for _ in range(min(connections, self.pool_size))))
+        start = time.perf_counter()
+        asyncio.run_coroutine_threadsafe(open_connections(), self._loop).result()
+        return time.perf_counter() - start
+
+_MOCK_PERSONA_COUNT_PATTERN = re.compile(r"(?:면접관 수|Number of Interviewers):\s*(\d+)")
+_MOCK_QUESTION_COUNT_PATTERN = re.compile(r"(?:면접관별 질문 개수|Questions per Interviewer)\s*(\d+)")
+
+class MockBackend:
+    """실제 API 없이 첫 토큰까지의 지연 시간과 초당 토큰 수를 흉내 내는 로컬 LLM 백엔드입니다.
+    벤치마크와 부하 테스트용이며, 결과 정리 단계가 파싱할 수 있는 형태의 면접관/질문 텍스트를 돌려줍니다."""
+
+    def __init__(self, latency: float = 0.5, tokens_per_sec: float = 50.0, reply_tokens: int = 200):
+        self.latency = latency
+        self.tokens_per_sec = tokens_per_sec
+        self.reply_tokens = reply_tokens
+
+    def _reply_tokens(self, messages: list) -> list:
+        korean = bool(_HANGUL_PATTERN.search(messages[0]["content"]))
+        if korean:
+            lines = ["*   **이름/성별:** 김민준/남성", "1. 최근 프로젝트에서 가장 어려웠던 문제는 무엇이었나요? (의도: 문제 해결 능력 확인)"]
+        else:
+            lines = ["*   **Name/Gender:** Michael Kim/Male", "1. What was the hardest problem in your recent project? (Intent: problem solving)"]
+        # 페르소나 요청에는 요청한 인원수만큼의 페르소나를 돌려줍니다 (3단계 면접관별 분할이 동작하도록).
+        persona_count = _MOCK_PERSONA_COUNT_PATTERN.search(messages[-1]["content"])
+        if persona_count:
+            per_persona = max(1, self.reply_tokens // int(persona_count.group(1)))
+            tokens = []
+            for _ in range(int(persona_count.group(1))):
+                persona = [word + " " for word in lines[0].split()]
+                while len(persona) < per_persona:
+                    persona.extend(word + " " for word in lines[1].split())
+                    persona[-1] = persona[-1].rstrip() + "\n"
+                persona = persona[:per_persona]
+                persona[len(lines[0].split()) - 1] = persona[len(lines[0].split()) - 1].rstrip() + "\n"
+                persona[-1] = persona[-1].rstrip() + "\n"
+                tokens.extend(persona)
+            return tokens
+        tokens = []
+        while len(tokens) < self.reply_tokens:
+            for line in lines:
+                tokens.extend(word + " " for word in line.split())
+                tokens[-1] = tokens[-1].rstrip() + "\n"
+        return tokens[:self.reply_tokens]
+
+    def _json_reply_tokens(self, messages: list, response_format: dict) -> list:
+        """JSON 스키마 출력 요청에는 요청한 인원수/질문 수에 맞는 JSON을 돌려줍니다 (reply_tokens는 적용하지 않습니다)."""
+        korean = bool(_HANGUL_PATTERN.search(messages[0]["content"]))
+        content = messages[-1]["content"]
+        if response_format["json_schema"]["name"] == "personas":
+            persona_count = _MOCK_PERSONA_COUNT_PATTERN.search(content)
+            persona = ({"name": "김민준", "gender": "남성", "age_range": "40대 초반", "position": "기술 개발팀 팀장",
+                        "experience": "15년차 개발자", "personality": "꼼꼼하고 분석적임", "interview_style": "경험 기반의 행동사례면접"}
+                       if korean else
+                       {"name": "Michael Kim", "gender": "Male", "age_range": "Early 40s", "position": "Engineering Team Lead",
+                        "experience": "15-year veteran developer", "personality": "Detail-oriented and analytical",
+                        "interview_style": "Behavioral Event Interview"})
+            data = {"personas": [persona] * (int(persona_count.group(1)) if persona_count else 1)}
+        else:
+            question_count = _MOCK_QUESTION_COUNT_PATTERN.search(content)
+            question = ({"question": "최근 프로젝트에서 가장 어려웠던 문제는 무엇이었나요?", "intent": "문제 해결 능력 확인"}
+                        if korean else
+                        {"question": "What was the hardest problem in your recent project?", "intent": "Problem solving"})
+            interviewer = {"name": "김민준" if korean else "Michael Kim",
+                           "questions": [question] * (int(question_count.group(1)) if question_count else 1)}
+            # 프롬프트에 들어 있는 페르소나 수만큼 면접관 항목을 만듭니다.
+            data = {"interviewers": [interviewer] * max(1, content.count('"interview_style"'))}
+        return re.findall(r"\S+\s*", json.dumps(data, ensure_ascii=False))
+
+    def _usage(self, messages: list, tokens: list) -> dict:
+        prompt_tokens = sum(estimate_tokens(message["content"]) for message in messages)
+        return {"prompt_tokens": prompt_tokens, "completion_tokens": len(tokens)}
+
+    def complete(self, model: str, messages: list, on_usage=None, response_format: dict = None, cancel=None) -> str:
+        tokens = self._json_reply_tokens(messages, response_format) if response_format else self._reply_tokens(messages)
+        delay = self.latency + len(tokens) / self.tokens_per_sec
+        if cancel is None:
+            time.sleep(delay)
+        elif cancel.wait(delay):
+            raise CallCancelled("LLM call cancelled while in flight")
+        if on_usage:
+            on_usage(self._usage(messages, tokens))
+        return "".join(tokens).strip()
+
+    def stream(self, model: str, messages: list, on_usage=None, response_format: dict = None, deadline: float = None):
+        tokens = self._json_reply_tokens(messages, response_format) if response_format else self._reply_tokens(messages)
+        time.sleep(self.latency)
+        for token in tokens:
+            time.sleep(1 / self.tokens_per_sec)
+            yield token
+        if on_usage:
+            on_usage(self._usage(messages, tokens))
+
+def create_llm_backend():
+    """LLM_BACKEND 환경 변수에 맞는 백엔드를 생성합니다."""
+    if LLM_BACKEND == "mock":
+        print(f"LLM 백엔드: mock (지연 {MOCK_LLM_LATENCY}초, 초당 {MOCK_LLM_TOKENS_PER_SEC}토큰)")
+        return MockBackend(MOCK_LLM_LATENCY, MOCK_LLM_TOKENS_PER_SEC, MOCK_LLM_REPLY_TOKENS)
+    try:
+        import together  # 첫 LLM 호출 때 불러옵니다
+        # 재시도는 _complete_with_retry에서만 합니다. SDK 자체 재시도(기본 2회)는 호출 제한 슬롯을 쥔 채로
+        # RUN_DEADLINE과 무관하게 백오프하므로 끕니다.
+        if not LLM_ASYNC_CLIENT:
+            return TogetherBackend(together.Together(api_key=api_key, max_retries=0))
+        import httpx
+        # 풀 크기만큼만 동시에 요청하므로 httpx 풀에서 연결을 기다리다 시간 초과되는 일은 없습니다.
+        limits = httpx.Limits(max_connections=LLM_POOL_SIZE, max_keepalive_connections=LLM_POOL_SIZE,
+                              keepalive_expiry=LLM_POOL_KEEPALIVE)
+        client = together.AsyncTogether(api_key=api_key, max_retries=0,
+                                        http_client=together.DefaultAsyncHttpxClient(limits=limits))
+        print(f"LLM 백엔드: 공유 비동기 클라이언트 (연결 풀 {LLM_POOL_SIZE}개)")
+        return AsyncTogetherBackend(client, LLM_POOL_SIZE)
+    except Exception as e:
+        print(f"오류: Together.ai 클라이언트 초기화에 실패했습니다. 에러: {e}")
+        raise
+
+_llm_backend = None
+_llm_backend_lock = threading.Lock()
+
+def get_llm_backend():
+    """LLM 백엔드를 처음 사용할 때 생성해 모든 세션이 공유합니다."""
+    global _llm_backend
+    with _llm_backend_lock:
+        if _llm_backend is None:
+            _llm_backend = create_llm_backend()
+        return _llm_backend
+
+def warm_up_llm_backend():
+    """서버 시작 직후 백엔드를 만들고 연결을 미리 열어, 첫 요청이 TLS/연결 설정 시간을 치르지 않게 합니다."""
+    try:
+        backend = get_llm_backend()
+        if LLM_WARMUP_CONNECTIONS > 0 and hasattr(backend, "warm_up"):
+            seconds = backend.warm_up(LLM_WARMUP_CONNECTIONS)
+            startup_timings["llm warm-up"] = seconds
+            print(f"LLM 연결 워밍업 완료: 연결 {min(LLM_WARMUP_CONNECTIONS, backend.pool_size)}개, {seconds:.2f}초")
+    except Exception as e:
+        # 워밍업 실패는 치명적이지 않습니다. 첫 요청에서 다시 연결합니다.
+        print(f"LLM 연결 워밍업 실패: {e}")
+
+# --- [신규] 모델별 LLM 호출 제한 ---
+class DeadlineExceeded(TimeoutError):
+    """요청 전체에 허용된 시간이 지났을 때 발생합니다. 재시도나 대체 모델 전환을 하지 않습니다."""
+
+class CallCancelled(Exception):
+    """호출한 쪽에서 결과가 더 이상 필요 없어 중단된 호출입니다. 재시도나 대체 모델 전환을 하지 않습니다."""
+
+def _remaining(deadline: float):
+    """deadline까지 남은 시간(초)을 반환합니다. deadline이 없으면 None, 이미 지났으면 0입니다."""
+    if deadline is None:
+        return None
+    return max(0.0, deadline - time.monotonic())
+
+class ModelLimiter:
+    """토큰 버킷(초당 요청 수)과 동시 요청 수 제한을 함께 적용하며, 대기 순서는 도착 순서(FIFO)를 따릅니다."""
+
+    def __init__(self, max_in_flight: int, rate_per_sec: float, burst: int):
+        self.max_in_flight = max_in_flight
+        # 0 이하이면 토큰 버킷을 쓰지 않습니다 (토큰이 다시 채워지지 않아 영원히 기다리는 것을 막습니다).
+        self.rate_per_sec = rate_per_sec if rate_per_sec > 0 else None
+        self.burst = max(1, burst)
+        self.in_flight = 0
+        self._tokens = float(self.burst)
+        self._updated = time.monotonic()
+        self._waiters = deque()
+        self._cond = threading.Condition()
+        # 알림이 있을 때마다 늘어나는 값. _cond 밖에서 슬롯을 확인하는 동안 놓친 알림을 알아차리는 데 씁니다.
+        self._generation = 0
+
+    def _refill(self):
+        now = time.monotonic()
+        if self.rate_per_sec is None:
+            self._tokens = float(self.burst)
+        else:
+            self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate_per_sec)
+        self._updated = now
+
+    def _try_acquire(self):
+        """대기열 맨 앞에서 _cond 밖에서 호출됩니다. 슬롯을 얻으면 _release에 넘길 값을, 못 얻으면 None을 반환합니다."""
+        with self._cond:
+            self._refill()
+            if self.in_flight < self.max_in_flight and self._tokens >= 1:
+                self._tokens -= 1
+                return True
+            return None
+
+    def _release(self, lease):
+        """_try_acquire로 얻은 슬롯을 반납합니다 (_cond 밖에서 호출됩니다)."""
+
+    def _notify(self):
+        """대기 중인 스레드를 깨웁니다 (_cond 보유 상태)."""
+        self._generation += 1
+        self._cond.notify_all()
+
+    def wake(self):
+        """기다리는 스레드를 깨워 취소 여부 등을 다시 확인하게 합니다."""
+        with self._cond:
+            self._notify()
+
+    def _wait_timeout(self):
+        """슬롯 상태를 다시 확인하기 전까지 기다릴 시간(초)입니다. None이면 다른 스레드의 알림을 기다립니다."""
+        self._refill()
+        if self.rate_per_sec is None or self._tokens >= 1:
+            return None
+        return (1 - self._tokens) / self.rate_per_sec
+
+    @contextmanager
+    def slot(self, on_wait=None, deadline: float = None, cancel=None):
+        """호출 슬롯을 얻을 때까지 기다립니다. 기다리는 동안 대기 순번이 바뀔 때마다 on_wait(순번)을 호출하며,
+        deadline(time.monotonic 기준)까지 슬롯을 얻지 못하면 DeadlineExceeded를 발생시킵니다.
+        cancel(threading.Event)이 설정되면 기다리지 않고 CallCancelled를 발생시킵니다 (설정한 쪽에서 wake()를 호출합니다)."""
+        ticket = object()
+        last_position = None
+        with self._cond:
+            self._waiters.append(ticket)
+        try:
+            while True:
+                with self._cond:
+                    position = self._waiters.index(ticket) + 1
+                    generation = self._generation
+                if cancel is not None and cancel.is_set():
+                    raise CallCancelled("LLM call cancelled while waiting for a slot")
+                # 슬롯 확인(공유 제한기는 sqlite 왕복)은 _cond 밖에서 합니다. 맨 앞의 대기자만 확인하므로 순서는 그대로 유지되고,
+                # 다른 프로세스의 느린 쓰기가 이 프로세스의 다른 스레드를 멈춰 세우지 않습니다.
+                lease = self._try_acquire() if position == 1 else None
+                if lease is not None:
+                    break
+                remaining = _remaining(deadline)
+                if remaining == 0:
+                    raise DeadlineExceeded("deadline exceeded while waiting for an LLM slot")
+                if on_wait and position != last_position:
+                    on_wait(position)
+                    last_position = position
+                with self._cond:
+                    if self._generation != generation:
+                        # 슬롯을 확인하는 동안 상태가 바뀌었으면 기다리지 않고 다시 확인합니다.
+                        continue
+                    timeout = self._wait_timeout()
+                    if remaining is not None:
+                        timeout = remaining if timeout is None else min(timeout, remaining)
+                    self._cond.wait(timeout=timeout)
+        except BaseException:
+            # 기한 초과, on_wait에서의 중단, 슬롯 확인 오류 모두 대기열에서 빠져 다음 대기자가 진행할 수 있게 합니다.
+            with self._cond:
+                self._waiters.remove(ticket)
+                self._notify()
+            raise
+        with self._cond:
+            self._waiters.remove(ticket)
+            self.in_flight += 1
+            self._notify()
+        try:
+            yield
+        finally:
+            with self._cond:
+                self.in_flight -= 1
+            try:
+                self._release(lease)
+            finally:
+                with self._cond:
+                    self._notify()
+
+    def stats(self) -> dict:
+        with self._cond:
+            return {"in_flight": self.in_flight, "waiting": len(self._waiters)}
+
+class SharedModelLimiter(ModelLimiter):
+    """여러 워커 프로세스가 sqlite로 토큰 버킷과 동시 요청 수를 공유하는 호출 제한기입니다.
+    프로세스 안에서는 도착 순서(FIFO)를 유지하고, 대기열 맨 앞의 요청만 공유 상태를 확인합니다.
+    진행 중인 요청은 만료 시각이 있는 임대(lease)로 기록하므로 워커가 비정상 종료해도 슬롯이 영구히 묶이지 않습니다."""
+
+    def __init__(self, path: str, model: str, max_in_flight: int, rate_per_sec: float, burst: int,
+                 lease_ttl: float = RUN_DEADLINE):
+        super().__init__(max_in_flight, rate_per_sec, burst)
+        self.model = model
+        self.lease_ttl = lease_ttl
+        self.path = path
+        # 슬롯 확인과 반납은 _cond 밖에서 여러 스레드가 동시에 하므로 스레드마다 연결을 따로 씁니다.
+        self._local = threading.local()
+        conn = self._db()
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS limiter_buckets (model TEXT PRIMARY KEY, tokens REAL NOT NULL, updated REAL NOT NULL)"
+        )
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS limiter_leases (lease TEXT PRIMARY KEY, model TEXT NOT NULL, expires REAL NOT NULL)"
+        )
+        conn.commit()
+
+    def _db(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            # 잠금 대기는 짧게 두고, 잠겨 있으면 슬롯을 얻지 못한 것으로 보고 SHARED_LIMITER_POLL 뒤에 다시 확인합니다.
+            conn = self._local.conn = connect_shared_db(self.path, timeout=SHARED_LIMITER_LOCK_TIMEOUT)
+        return conn
+
+    def _try_acquire(self):
+        now = time.time()
+        conn = self._db()
+        try:
+            with conn:
+                conn.execute("BEGIN IMMEDIATE")
+                conn.execute("DELETE FROM limiter_leases WHERE expires < ?", (now,))
+                row = conn.execute("SELECT tokens, updated FROM limiter_buckets WHERE model = ?", (self.model,)).fetchone()
+                if row is None or self.rate_per_sec is None:
+                    tokens = self.burst
+                else:
+                    tokens = min(self.burst, row[0] + (now - row[1]) * self.rate_per_sec)
+                in_flight = conn.execute("SELECT COUNT(*) FROM limiter_leases WHERE model = ?", (self.model,)).fetchone()[0]
+                lease = None
+                if in_flight < self.max_in_flight and tokens >= 1:
+                    tokens -= 1
+                    lease = uuid.uuid4().hex
+                    conn.execute("INSERT INTO limiter_leases (lease, model, expires) VALUES (?, ?, ?)",
+                                 (lease, self.model, now + self.lease_ttl))
+                conn.execute("INSERT OR REPLACE INTO limiter_buckets (model, tokens, updated) VALUES (?, ?, ?)",
+                             (self.model, tokens, now))
+        except sqlite3.OperationalError as e:
+            # 다른 프로세스가 오래 쓰고 있으면(database is locked) 이번 확인은 실패로 보고 다음 확인 때 다시 시도합니다.
+            print(f"공유 호출 제한 상태 확인 실패 ('{self.model}'), 다시 시도합니다: {e}")
+            return None
+        return lease
+
+    def _release(self, lease):
+        last_error = None
+        for attempt in range(max(1, SHARED_LIMITER_RELEASE_ATTEMPTS)):
+            try:
+                with self._db() as conn:
+                    conn.execute("DELETE FROM limiter_leases WHERE lease = ?", (lease,))
+                return
+            except sqlite3.OperationalError as e:
+                last_error = e
+                time.sleep(SHARED_LIMITER_POLL)
+        print(f"호출 슬롯 반납 실패 ('{self.model}'), {self.lease_ttl:.0f}초 뒤 만료됩니다: {last_error}")
+
+    def _wait_timeout(self):
+        # 다른 워커가 슬롯을 반납해도 알림을 받을 수 없으므로 짧은 간격으로 다시 확인합니다.
+        return SHARED_LIMITER_POLL
+
+    def stats(self) -> dict:
+        stats = super().stats()
+        try:
+            stats["in_flight"] = self._db().execute(
+                "SELECT COUNT(*) FROM limiter_leases WHERE model = ? AND expires >= ?", (self.model, time.time())
+            ).fetchone()[0]
+        except sqlite3.OperationalError as e:
+            print(f"공유 호출 제한 상태 조회 실패 ('{self.model}'): {e}")
+        return stats
+
+# 헤징 요청처럼 호출 스레드와 별도로 실행되는 LLM 요청용 스레드 풀입니다.
+llm_executor = ThreadPoolExecutor(max_workers=LLM_MAX_IN_FLIGHT * 4, thread_name_prefix="llm")
+
+_model_limiters = {}
+_model_limiters_lock = threading.Lock()
+
+def get_model_limiter(model: str) -> ModelLimiter:
+    """모델 ID별 호출 제한기를 반환합니다. MODELS와 LLAMA_MODEL_ID의 모델은 서로 다른 제한을 받습니다."""
+    with _model_limiters_lock:
+        if model not in _model_limiters:
+            if SHARED_STATE_DB:
+                _model_limiters[model] = SharedModelLimiter(SHARED_STATE_DB, model, LLM_MAX_IN_FLIGHT, LLM_RATE_PER_SEC, LLM_BURST)
+            else:
+                _model_limiters[model] = ModelLimiter(LLM_MAX_IN_FLIGHT, LLM_RATE_PER_SEC, LLM_BURST)
+        return _model_limiters[model]
+
 # --- 백엔드 함수 정의 ---
 def show_upload_feedback(file_obj, lang):
     """파일이 업로드되면 확인 메시지를 반환하는 함수"""
@@ -258,41 +1696,586 @@ def show_upload_feedback(file_obj, lang):
         return LANG_STRINGS[lang]['upload_success']
     return ""
 
-def upload_to_gcs(bucket_name: str, source_file_path: str, destination_blob_name: str):
-    """로컬 파일을 Google Cloud Storage 버킷에 업로드합니다."""
-    if not storage_client:
+def upload_to_gcs(bucket_name: str, source_file_path, destination_blob_name: str):
+    """로컬 파일(경로 또는 bytes)의 Google Cloud Storage 업로드를 백그라운드 업로더에 맡기고 즉시 반환합니다."""
+    uploader = get_gcs_uploader()
+    if not uploader or uploader.bucket_name != bucket_name:
         print("GCS 클라이언트가 초기화되지 않아 업로드를 건너뜁니다.")
         return
+    uploader.submit(source_file_path, destination_blob_name)
+
+def _page_stream_bytes(page) -> int:
+    """페이지 콘텐츠 스트림의 (압축된) 크기 합계를 텍스트 추출 없이 계산합니다."""
+    contents = page.get("/Contents")
+    if contents is None:
+        return 0
+    contents = contents.get_object()
+    streams = contents if isinstance(contents, list) else [contents]
+    return sum(int(stream.get_object().get("/Length", 0) or 0) for stream in streams)
+
+def iter_pdf_pages(reader, max_pages: int, max_chars: int, time_limit: float, max_stream_bytes: int):
+    """페이지 텍스트를 앞에서부터 하나씩 반환합니다. 한도에 닿으면 멈추고 마지막에 ("truncated", 이유)를 반환합니다."""
+    start = time.monotonic()
+    chars = 0
+    for index, page in enumerate(reader.pages):
+        if index >= max_pages:
+            yield ("truncated", "pages")
+            return
+        if time.monotonic() - start > time_limit:
+            yield ("truncated", "time")
+            return
+        if _page_stream_bytes(page) > max_stream_bytes:
+            yield ("truncated", "stream")
+            return
+        text = (page.extract_text() or "")[:PDF_MAX_PAGE_CHARS]
+        if chars + len(text) > max_chars:
+            yield ("page", text[:max_chars - chars])
+            yield ("truncated", "chars")
+            return
+        chars += len(text)
+        yield ("page", text)
+
+def extract_text_from_pdf(pdf_path, max_pages: int = PDF_MAX_PAGES, max_chars: int = PDF_MAX_CHARS,
+                          time_limit: float = PDF_TIME_LIMIT) -> tuple:
+    """PDF 파일(경로 또는 bytes)에서 텍스트를 페이지 단위로 한도 안에서 추출합니다.
+
+    (텍스트, 정보)를 반환합니다. 정보는 {"pages_read", "total_pages", "truncated"}이며, 실패하면 ("오류: ...", None)입니다.
+    """
     try:
-        bucket = storage_client.bucket(bucket_name)
-        blob = bucket.blob(destination_blob_name)
-        blob.upload_from_filename(source_file_path)
-        print(f"파일 '{source_file_path}'를(을) 버킷 '{bucket_name}'에 '{destination_blob_name}'(으)로 업로드했습니다.")
-    except Exception as e:
-        print(f"GCS 업로드 중 오류 발생: {e}")
-
-def extract_text_from_pdf(pdf_path: str) -> str:
-    """PDF 파일에서 텍스트를 추출합니다."""
-    try:
-        with open(pdf_path, 'rb') as file:
+        import PyPDF2  # PDF 추출 프로세스에서 처음 사용할 때 불러옵니다
+        size = len(pdf_path) if isinstance(pdf_path, bytes) else os.path.getsize(pdf_path)
+        if size > PDF_MAX_FILE_MB * 1024 * 1024:
+            return f"오류: PDF 파일이 너무 큽니다 (최대 {PDF_MAX_FILE_MB:g}MB).", None
+        with (io.BytesIO(pdf_path) if isinstance(pdf_path, bytes) else open(pdf_path, 'rb')) as file:
             reader = PyPDF2.PdfReader(file)
-            text = "".join(page.extract_text() or "" for page in reader.pages)
-            return text
+            # 전체 페이지 트리를 펼치기 전에 문서가 선언한 페이지 수로 먼저 거부합니다.
+            total_pages = int(reader.trailer["/Root"]["/Pages"].get("/Count", 0))
+            if total_pages > PDF_REJECT_PAGES:
+                return f"오류: PDF 페이지 수가 너무 많습니다 ({total_pages}페이지).", None
+            pages, truncated = [], None
+            for kind, value in iter_pdf_pages(reader, max_pages, max_chars, time_limit,
+                                              int(PDF_MAX_STREAM_MB * 1024 * 1024)):
+                if kind == "page":
+                    pages.append(value)
+                else:
+                    truncated = value
+            # 페이지 경계는 이력서 압축 단계에서 머리글/바닥글을 찾는 데 사용하므로 \f로 구분합니다.
+            info = {"pages_read": len(pages), "total_pages": total_pages, "truncated": truncated}
+            return "\f".join(pages), info
     except FileNotFoundError:
-        return f"오류: PDF 파일을 찾을 수 없습니다. 경로: {pdf_path}"
+        return f"오류: PDF 파일을 찾을 수 없습니다. 경로: {pdf_path}", None
     except Exception as e:
-        return f"PDF 처리 중 오류 발생: {e}"
-
-def call_llm(prompt: str, chat_history: list, model: str) -> str:
-    """Together.ai API를 호출하고, 실패 시 오류 메시지를 반환하며 대화 히스토리를 유지합니다."""
+        return f"오류: PDF 처리 중 문제가 발생했습니다: {e}", None
+
+_pdf_executor = None
+_pdf_executor_lock = threading.Lock()
+
+def get_pdf_executor() -> ProcessPoolExecutor:
+    """PDF 추출용 프로세스 풀을 처음 사용할 때 생성합니다."""
+    global _pdf_executor
+    with _pdf_executor_lock:
+        if _pdf_executor is None:
+            _pdf_executor = ProcessPoolExecutor(max_workers=PDF_WORKERS)
+        return _pdf_executor
+
+def _reset_pdf_executor(executor: ProcessPoolExecutor):
+    """멈춘 추출 작업이 있는 프로세스 풀을 종료합니다. 다음 추출 때 새 풀을 만듭니다."""
+    global _pdf_executor
+    with _pdf_executor_lock:
+        if _pdf_executor is executor:
+            _pdf_executor = None
+    # 실행 중인 작업은 취소할 수 없으므로 작업 프로세스를 직접 종료합니다.
+    for process in list((getattr(executor, "_processes", None) or {}).values()):
+        process.terminate()
+    executor.shutdown(wait=False, cancel_futures=True)
+
+def file_sha256(path: str) -> str:
+    """파일 내용의 SHA-256 해시를 계산합니다."""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as file:
+        for block in iter(lambda: file.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+def extract_text_cached(pdf_path, digest: str = None) -> tuple:
+    """파일 내용 해시로 캐시된 추출 결과 (텍스트, 정보)를 반환하고, 캐시에 없으면 프로세스 풀에서 추출합니다.
+    pdf_path는 파일 경로 또는 PDF 내용(bytes)이며, 내용 해시(digest)를 이미 알고 있으면 함께 넘깁니다."""
+    try:
+        digest = digest or (hashlib.sha256(pdf_path).hexdigest() if isinstance(pdf_path, bytes) else file_sha256(pdf_path))
+    except FileNotFoundError:
+        return f"오류: PDF 파일을 찾을 수 없습니다. 경로: {pdf_path}", None
+    cached = pdf_cache.get(digest)
+    if cached is not None:
+        return cached
+    for attempt in range(2):
+        executor = get_pdf_executor()
+        try:
+            result = executor.submit(extract_text_from_pdf, pdf_path).result(timeout=PDF_HARD_TIMEOUT)
+            break
+        except FutureTimeoutError:
+            print(f"PDF 추출이 {PDF_HARD_TIMEOUT:g}초 안에 끝나지 않아 추출 프로세스를 종료합니다.")
+            _reset_pdf_executor(executor)
+            return f"오류: PDF 처리 시간이 너무 오래 걸립니다 (최대 {PDF_HARD_TIMEOUT:g}초).", None
+        except BrokenProcessPool as e:
+            # 다른 요청의 멈춘 추출 때문에 풀이 종료되었으면 새 풀에서 한 번 더 시도합니다.
+            _reset_pdf_executor(executor)
+            if attempt:
+                return f"오류: PDF 처리 중 문제가 발생했습니다: {e}", None
+        except Exception as e:
+            return f"오류: PDF 처리 중 문제가 발생했습니다: {e}", None
+    if result[1] is not None:
+        pdf_cache.set(digest, result)
+    return result
+
+# --- [신규] 이력서 압축 ---
+_CJK_PATTERN = re.compile(r"[\u1100-\u11ff\u3040-\u30ff\u3130-\u318f\u4e00-\u9fff\uac00-\ud7af]")
+
+def estimate_tokens(text: str) -> int:
+    """토크나이저 없이 토큰 수를 추정합니다. 한글/한자는 글자당 1토큰, 그 외는 4글자당 1토큰으로 계산합니다."""
+    cjk_count = len(_CJK_PATTERN.findall(text))
+    return cjk_count + (len(text) - cjk_count + 3) // 4
+
+def _normalize_page(page: str) -> list:
+    """페이지 텍스트의 공백을 정리하고 연속된 빈 줄은 하나로 합칩니다."""
+    lines = []
+    for line in page.splitlines():
+        line = " ".join(line.split())
+        if line or (lines and lines[-1]):
+            lines.append(line)
+    return lines
+
+# "3", "- 3 -", "Page 3", "3 / 10", "3 of 10", "3페이지" 같은 쪽 번호만 있는 줄
+_PAGE_NUMBER_PATTERN = re.compile(
+    r"^(?:page|p\.|페이지)?\s*[-–(\[]?\s*\d+\s*(?:(?:/|of)\s*\d+)?\s*[-–)\]]?\s*(?:페이지|쪽)?$", re.IGNORECASE
+)
+
+def _margin_entries(lines: list) -> list:
+    """페이지의 위/아래 3줄을 (위치, 비교용 줄, 줄 번호)로 반환합니다. 위치는 위에서 0, 1, 2, 아래에서 -1, -2, -3입니다.
+    쪽 번호만 있는 줄은 번호와 상관없이 같은 줄로 비교하고, 그 외의 줄은 글자 그대로 비교합니다."""
+    content = [index for index, line in enumerate(lines) if line]
+    positions = [(position, index) for position, index in enumerate(content[:3])]
+    positions += [(-position, index) for position, index in enumerate(reversed(content[-3:]), start=1)]
+    entries = []
+    for position, index in positions:
+        key = "#page" if _PAGE_NUMBER_PATTERN.match(lines[index]) else lines[index]
+        entries.append((position, key, index))
+    return entries
+
+def _repeated_margin_lines(pages: list) -> set:
+    """대부분의 페이지에서 같은 여백 위치(위/아래 3줄)에 똑같이 반복되는 머리글과 바닥글을 (위치, 비교용 줄)로 찾습니다."""
+    if len(pages) < 2:
+        return set()
+    counts = {}
+    for lines in pages:
+        for position, key, _ in set(_margin_entries(lines)):
+            counts[(position, key)] = counts.get((position, key), 0) + 1
+    # 절반을 넘는 페이지(최소 2페이지)에서 반복되어야 머리글/바닥글로 봅니다.
+    threshold = max(2, len(pages) // 2 + 1)
+    return {entry for entry, count in counts.items() if count >= threshold}
+
+def _strip_margin_lines(lines: list, margin_lines: set) -> list:
+    """페이지에서 반복되는 머리글/바닥글을 그 여백 위치에 있을 때만 지웁니다."""
+    drop = {index for position, key, index in _margin_entries(lines) if (position, key) in margin_lines}
+    return [line for index, line in enumerate(lines) if index not in drop]
+
+def _split_sections(pages: list, max_section_tokens: int = 400) -> list:
+    """빈 줄과 페이지 경계를 기준으로 섹션을 나누고, 너무 긴 섹션은 줄 단위로 다시 나눕니다."""
+    sections = []
+    for lines in pages:
+        current = []
+        for line in lines + [""]:
+            if line:
+                current.append(line)
+                if estimate_tokens("\n".join(current)) < max_section_tokens:
+                    continue
+            if current:
+                sections.append("\n".join(current))
+                current = []
+    return sections
+
+def compact_resume(resume_text: str, token_budget: int, keywords: list) -> tuple:
+    """이력서 본문을 정리하고 토큰 예산에 맞게 줄입니다.
+    반환값: (압축된 텍스트, 원문 추정 토큰 수, 압축 후 추정 토큰 수)"""
+    tokens_before = estimate_tokens(resume_text)
+    pages = [_normalize_page(page) for page in resume_text.split("\f")]
+    if tokens_before > token_budget:
+        # 예산 안에 들어오는 이력서는 머리글/바닥글 제거로 내용을 잃을 위험을 감수하지 않습니다.
+        margin_lines = _repeated_margin_lines(pages)
+        deduped = [_strip_margin_lines(lines, margin_lines) for lines in pages]
+        if any(line for lines in deduped for line in lines):
+            pages = deduped
+    sections = _split_sections(pages)
+
+    section_tokens = [estimate_tokens(section) for section in sections]
+    if sum(section_tokens) > token_budget:
+        # 직무/회사 키워드가 많이 등장하고 앞쪽에 있는 섹션을 우선 남기고, 남긴 섹션은 원래 순서대로 출력합니다.
+        keywords = [keyword.casefold() for keyword in keywords if len(keyword) >= 2]
+        def score(index):
+            lowered = sections[index].casefold()
+            keyword_hits = sum(lowered.count(keyword) for keyword in keywords)
+            return keyword_hits * 2 + 1.0 / (1 + index * 0.1)
+        selected = {}
+        remaining = token_budget
+        for index in sorted(range(len(sections)), key=score, reverse=True):
+            if remaining <= 0:
+                break
+            if section_tokens[index] <= remaining:
+                selected[index] = sections[index]
+                remaining -= section_tokens[index]
+            elif remaining >= 50:
+                # 예산이 어느 정도 남아 있으면 섹션 앞부분만 잘라서 넣습니다.
+                ratio = remaining / section_tokens[index]
+                selected[index] = sections[index][:int(len(sections[index]) * ratio)]
+                remaining = 0
+        sections = [selected[index] for index in sorted(selected)]
+
+    compacted = "\n\n".join(sections)
+    if not compacted.strip() and resume_text.strip():
+        # 압축 결과가 비면 3단계가 이력서 없이 실행되므로, 정리한 원문을 예산 비율만큼 잘라 사용합니다.
+        normalized = "\n".join("\n".join(lines) for lines in pages).strip() or resume_text.strip()
+        ratio = min(1.0, token_budget / max(1, estimate_tokens(normalized)))
+        compacted = normalized[:max(1, int(len(normalized) * ratio))]
+    return compacted, tokens_before, estimate_tokens(compacted)
+
+# --- [신규] 면접관별 페르소나 분할 ---
+_PERSONA_START_PATTERN = re.compile(r"^[^\w\n]*(?:이름\s*/\s*성별|Name\s*/\s*Gender)", re.IGNORECASE)
+_PERSONA_HEADING_PATTERN = re.compile(r"^\s*(?:#|[*_\s]*(?:면접관|Interviewer)\s*\d)", re.IGNORECASE)
+
+def split_personas(interviewer_personas: str, expected: int):
+    """2단계 결과를 면접관별 페르소나 목록으로 나눕니다. 예상 인원수와 맞지 않으면 None을 반환합니다."""
+    lines = interviewer_personas.splitlines()
+    starts = [index for index, line in enumerate(lines) if _PERSONA_START_PATTERN.match(line)]
+    if expected < 2 or len(starts) != expected:
+        return None
+    # "### 면접관 2" 같은 제목 줄은 앞 페르소나의 끝이 아니라 다음 페르소나의 시작에 붙입니다.
+    for i in range(1, len(starts)):
+        while starts[i] - 1 > starts[i - 1] and (not lines[starts[i] - 1].strip()
+                                                 or _PERSONA_HEADING_PATTERN.match(lines[starts[i] - 1])):
+            starts[i] -= 1
+    starts[0] = 0
+    bounds = zip(starts, starts[1:] + [len(lines)])
+    return ["\n".join(lines[start:end]).strip() for start, end in bounds]
+
+# --- [신규] 로컬 결과 정리 ---
+summary_stats = {"local": 0, "fallback": 0, "llm": 0, "structured": 0}
+_summary_stats_lock = threading.Lock()
+
+_THOUGHT_PATTERN = re.compile(r"<thought>.*?</thought>", re.DOTALL | re.IGNORECASE)
+_STRUCTURED_LINE_PATTERN = re.compile(r"^\s*(#{1,6}\s|[-*•]\s|\d+[.)]\s|\*\*|\[|면접관|질문|Interviewer|Question|Q\d)", re.IGNORECASE)
+_QUESTION_LINE_PATTERN = re.compile(r"\?|？|\((의도|Intent)\s*:", re.IGNORECASE)
+_HANGUL_PATTERN = re.compile(r"[\uac00-\ud7af]")
+_LATIN_PATTERN = re.compile(r"[A-Za-z]")
+
+def _count_summary(name: str):
+    with _summary_stats_lock:
+        summary_stats[name] += 1
+
+def _is_english_sentence(line: str) -> bool:
+    """한글이 전혀 없고 영문이 대부분인 줄인지 판별합니다. 한글 문장 속 영문 기술 용어는 남깁니다."""
+    return not _HANGUL_PATTERN.search(line) and len(_LATIN_PATTERN.findall(line)) >= 8
+
+def _clean_section(text: str, lang: str) -> str:
+    """추론 블록과 앞뒤의 안내 문구를 제거하고, 한국어 모드에서는 영문 위주 문장을 지웁니다."""
+    lines = _THOUGHT_PATTERN.sub("", text).strip().splitlines()
+    if lang == 'ko':
+        lines = [line for line in lines if not _is_english_sentence(line)]
+    structured = [i for i, line in enumerate(lines) if _STRUCTURED_LINE_PATTERN.match(line)]
+    if not structured:
+        return ""
+    # 첫 구조화된 줄(제목, 목록, 번호) 이전의 인사말과 마지막 구조화된 단락 이후의 맺음말을 버립니다.
+    end = structured[-1]
+    while end + 1 < len(lines) and lines[end + 1].strip():
+        end += 1
+    return "\n".join(lines[structured[0]:end + 1]).strip()
+
+def summarize_locally(lang: str, interviewer_personas: str, final_questions_raw: str):
+    """요약 LLM 호출 없이 면접관 페르소나와 면접 질문만 남깁니다. 파싱에 실패하면 None을 반환합니다."""
+    personas = _clean_section(interviewer_personas, lang)
+    questions = _clean_section(final_questions_raw, lang)
+    if not personas or not questions:
+        return None
+    if not any(_QUESTION_LINE_PATTERN.search(line) for line in questions.splitlines()):
+        return None
+    if lang == 'ko':
+        return f"[면접관 페르소나]\n{personas}\n\n[면접 질문]\n{questions}"
+    return f"[Interviewer Personas]\n{personas}\n\n[Interview Questions]\n{questions}"
+
+# --- [신규] 구조화된(JSON) 출력 ---
+PERSONA_FIELDS = ("name", "gender", "age_range", "position", "experience", "personality", "interview_style")
+
+def personas_response_format(num_interviewers: int) -> dict:
+    """2단계 응답의 JSON 스키마입니다. 면접관 수만큼의 페르소나 목록을 요청합니다."""
+    persona = {"type": "object", "properties": {field: {"type": "string"} for field in PERSONA_FIELDS},
+               "required": list(PERSONA_FIELDS)}
+    schema = {"type": "object", "required": ["personas"], "properties": {
+        "personas": {"type": "array", "items": persona, "minItems": num_interviewers, "maxItems": num_interviewers},
+    }}
+    return {"type": "json_schema", "json_schema": {"name": "personas", "schema": schema}}
+
+def questions_response_format(num_interviewers: int, questions_per_interviewer: int) -> dict:
+    """3단계 응답의 JSON 스키마입니다. 면접관별로 질문과 질문 의도 목록을 요청합니다."""
+    question = {"type": "object", "required": ["question", "intent"],
+                "properties": {"question": {"type": "string"}, "intent": {"type": "string"}}}
+    interviewer = {"type": "object", "required": ["name", "questions"], "properties": {
+        "name": {"type": "string"},
+        "questions": {"type": "array", "items": question,
+                      "minItems": questions_per_interviewer, "maxItems": questions_per_interviewer},
+    }}
+    schema = {"type": "object", "required": ["interviewers"], "properties": {
+        "interviewers": {"type": "array", "items": interviewer, "minItems": num_interviewers, "maxItems": num_interviewers},
+    }}
+    return {"type": "json_schema", "json_schema": {"name": "interview_questions", "schema": schema}}
+
+class IncrementalJsonParser:
+    """스트리밍으로 도착하는 JSON 응답을 이어서 읽고, 지금까지 완성된 배열 항목만으로 이루어진 값을 돌려줍니다.
+    feed()에는 지금까지 누적된 전체 텍스트를 넘기며, 이미 읽은 부분은 다시 읽지 않습니다.
+    예: 질문 객체가 닫히는 즉시 그 질문까지 포함한 {"interviewers": [...]}를 얻을 수 있습니다."""
+
+    def __init__(self):
+        self.text = ""
+        self.start = None  # JSON 객체가 시작되는 위치 (앞의 추론 블록/코드 블록 표시는 건너뜁니다)
+        self.pos = 0
+        self.stack = []
+        self.in_string = False
+        self.escape = False
+        self.cut = None  # (마지막으로 완성된 배열 항목의 끝 위치, 그 시점에 열려 있던 괄호를 닫는 문자열)
+
+    def feed(self, text: str):
+        if text[:self.pos] != self.text[:self.pos]:
+            # 앞부분이 달라졌으면(최종 응답의 공백 제거 등) 처음부터 다시 읽습니다.
+            self.__init__()
+        self.text = text
+        if self.start is None:
+            thought_end = text.find("</thought>")
+            if "<thought>" in text and thought_end < 0:
+                return None
+            start = text.find("{", thought_end + len("</thought>") if thought_end >= 0 else 0)
+            if start < 0:
+                return None
+            self.start = self.pos = start
+        while self.pos < len(text) and (self.stack or self.pos == self.start):
+            char = text[self.pos]
+            if self.in_string:
+                if self.escape:
+                    self.escape = False
+                elif char == "\\":
+                    self.escape = True
+                elif char == '"':
+                    self.in_string = False
+                    if self.stack[-1] == "[":
+                        self._mark(self.pos + 1)
+            elif char == '"':
+                self.in_string = True
+            elif char in "{[":
+                self.stack.append(char)
+            elif char in "}]":
+                self.stack.pop()
+                if not self.stack or self.stack[-1] == "[":
+                    self._mark(self.pos + 1)
+            elif char == "," and self.stack[-1] == "[":
+                self._mark(self.pos)
+            self.pos += 1
+        return self.snapshot()
+
+    def _mark(self, end: int):
+        self.cut = (end, "".join("]" if bracket == "[" else "}" for bracket in reversed(self.stack)))
+
+    def snapshot(self):
+        """완성된 배열 항목까지만 남기고 열린 괄호를 닫아 파싱한 값을 반환합니다. 아직 없으면 None입니다."""
+        if self.cut is None:
+            return None
+        end, closing = self.cut
+        try:
+            return json.loads(self.text[self.start:end] + closing)
+        except json.JSONDecodeError:
+            return None
+
+def parse_structured_reply(reply: str, kind: str):
+    """JSON 응답을 파싱해 스키마에 맞는지 확인합니다.
+    kind가 "personas"이면 페르소나 목록을, "questions"이면 면접관별 질문 목록을 (값, None)으로 반환하고,
+    맞지 않으면 (None, 오류 설명)을 반환합니다."""
+    text = _THOUGHT_PATTERN.sub("", reply)
+    start, end = text.find("{"), text.rfind("}")
+    if start < 0 or end < start:
+        return None, "no JSON object in the response"
+    try:
+        data = json.loads(text[start:end + 1])
+    except json.JSONDecodeError as e:
+        return None, f"invalid JSON: {e}"
+    key = "personas" if kind == "personas" else "interviewers"
+    items = data.get(key) if isinstance(data, dict) else None
+    if not isinstance(items, list) or not items:
+        return None, f"'{key}' must be a non-empty list"
+    for index, item in enumerate(items, start=1):
+        if not isinstance(item, dict):
+            return None, f"{key}[{index}] is not an object"
+        if kind == "personas":
+            missing = [field for field in PERSONA_FIELDS if not isinstance(item.get(field), str) or not item[field].strip()]
+            if missing:
+                return None, f"{key}[{index}] is missing {', '.join(missing)}"
+            continue
+        questions = item.get("questions")
+        if not isinstance(item.get("name"), str) or not isinstance(questions, list) or not questions:
+            return None, f"{key}[{index}] needs a name and a non-empty questions list"
+        for number, question in enumerate(questions, start=1):
+            if not isinstance(question, dict) or not isinstance(question.get("question"), str) or not question["question"].strip():
+                return None, f"{key}[{index}].questions[{number}] has no question text"
+    return items, None
+
+def render_personas(T: dict, personas: list) -> str:
+    """페르소나 목록을 기존 페르소나 형식과 같은 목록으로 표시합니다."""
+    labels = T['structured_persona_labels']
+    blocks = []
+    for persona in personas:
+        lines = [f"*   **{labels['name_gender']}:** {persona.get('name', '')}/{persona.get('gender', '')}"]
+        lines += [f"*   **{labels[field]}:** {persona.get(field, '')}" for field in PERSONA_FIELDS[2:]]
+        blocks.append("\n".join(lines))
+    return "\n\n".join(blocks)
+
+def render_questions(T: dict, interviewers: list) -> str:
+    """면접관별 질문 목록을 "번호. 질문 (의도: ...)" 형식으로 표시합니다. 스트리밍 중의 부분 결과에도 사용합니다."""
+    blocks = []
+    for interviewer in interviewers:
+        if not isinstance(interviewer, dict):
+            continue
+        lines = [f"**{interviewer['name']}**"] if interviewer.get("name") else []
+        for number, item in enumerate(interviewer.get("questions") or [], start=1):
+            if not isinstance(item, dict) or not item.get("question"):
+                continue
+            line = f"{number}. {item['question']}"
+            if item.get("intent"):
+                line += f" ({T['structured_intent_label']}: {item['intent']})"
+            lines.append(line)
+        if lines:
+            blocks.append("\n".join(lines))
+    return "\n\n".join(blocks)
+
+def render_structured_result(T: dict, personas: list, interviewers: list) -> str:
+    """요약 LLM 호출 없이 구조화된 결과에서 최종 결과(면접관 페르소나 + 면접 질문)를 만듭니다."""
+    return (f"{T['structured_personas_header']}\n{render_personas(T, personas)}\n\n"
+            f"{T['structured_questions_header']}\n{render_questions(T, interviewers)}")
+
+def build_prompt(T: dict, template_key: str, input_key: str = None, **values) -> tuple:
+    """프롬프트를 (대화 히스토리, 사용자 프롬프트)로 조립합니다.
+    변하지 않는 지시문(LANG_STRINGS의 템플릿 본문)은 system 메시지로 맨 앞에 두고, 요청마다 달라지는 내용은
+    그 뒤의 사용자 프롬프트에 한 번만 넣습니다. 모든 요청의 앞부분이 같아지므로 제공자 측 prefix 캐시가 적중할 수 있습니다.
+    사용자 프롬프트 템플릿은 기본적으로 "{template_key}_input"이며, input_key로 다른 템플릿을 지정할 수 있습니다."""
+    chat_history = [{"role": "system", "content": T[template_key]}]
+    return chat_history, T[input_key or f"{template_key}_input"].format(**values)
+
+def _is_transient_error(error: Exception) -> bool:
+    """재시도할 만한 일시적인 오류(429, 5xx, 연결/타임아웃 오류)인지 판별합니다."""
+    status = getattr(error, "status_code", None) or getattr(error, "http_status", None)
+    if isinstance(status, int):
+        return status in (408, 409, 429) or status >= 500
+    if isinstance(error, (TimeoutError, ConnectionError)):
+        return True
+    return type(error).__name__ in ("APIConnectionError", "APITimeoutError", "Timeout", "RateLimitError", "ServiceUnavailableError")
+
+def _backoff_before_retry(error: Exception, attempt: int, deadline: float) -> bool:
+    """재시도할 수 있으면 지터를 넣은 지수 백오프만큼 기다린 뒤 True를, 아니면 False를 반환합니다."""
+    if isinstance(error, DeadlineExceeded) or not _is_transient_error(error) or attempt >= LLM_MAX_RETRIES:
+        return False
+    delay = LLM_RETRY_BACKOFF * (2 ** attempt) * random.uniform(0.5, 1.5)
+    remaining = _remaining(deadline)
+    if remaining is not None and delay >= remaining:
+        return False
+    print(f"LLM 호출 재시도 대기 {delay:.1f}초 (시도 {attempt + 1}/{LLM_MAX_RETRIES + 1})")
+    time.sleep(delay)
+    return True
+
+def _model_candidates(model: str) -> list:
+    """기본 모델과, 있다면 대체 모델을 순서대로 반환합니다."""
+    fallback = FALLBACK_MODELS.get(model)
+    return [model, fallback] if fallback and fallback != model else [model]
+
+def _complete_once(model: str, messages: list, on_wait, deadline: float, labels: dict, response_format: dict = None,
+                   cancel=None) -> str:
+    """호출 제한 슬롯을 얻어 한 번 호출하고 응답 텍스트를 반환합니다. 토큰 사용량은 labels로 기록합니다.
+    cancel(threading.Event)이 설정되면 슬롯 대기나 진행 중인 요청을 멈추고 CallCancelled를 발생시킵니다."""
+    with get_model_limiter(model).slot(on_wait, deadline, cancel):
+        return get_llm_backend().complete(model, messages, on_usage=lambda usage: record_token_usage(model, labels, usage),
+                                          response_format=response_format, cancel=cancel)
+
+def _complete_hedged(model: str, messages: list, on_wait, deadline: float, labels: dict, response_format: dict = None) -> str:
+    """LLM_HEDGE_AFTER초 안에 응답이 없으면 같은 요청을 한 번 더 보내 먼저 성공한 응답을 사용합니다.
+    deadline이 지나면 끝나지 않은 요청을 기다리지 않고 DeadlineExceeded를 발생시킵니다.
+    결과가 정해지면 남은 요청은 취소해 호출 제한 슬롯을 돌려줍니다."""
+    if not LLM_HEDGE_AFTER and deadline is None:
+        return _complete_once(model, messages, on_wait, deadline, labels, response_format)
+    # 요청(future)별 취소 이벤트
+    cancels = {}
+
+    def submit():
+        cancel = threading.Event()
+        future = llm_executor.submit(_complete_once, model, list(messages), on_wait, deadline, labels, response_format, cancel)
+        cancels[future] = cancel
+        return future
+
+    pending = {submit()}
+    hedged = not LLM_HEDGE_AFTER
+    last_error = None
+    try:
+        while pending:
+            timeout = _remaining(deadline)
+            if not hedged:
+                timeout = LLM_HEDGE_AFTER if timeout is None else min(timeout, LLM_HEDGE_AFTER)
+            done, pending = wait(pending, timeout=timeout, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None:
+                    return future.result()
+                last_error = future.exception()
+            if done:
+                continue
+            if _remaining(deadline) == 0:
+                raise DeadlineExceeded("deadline exceeded while waiting for the LLM response")
+            hedged = True
+            print(f"LLM 응답이 {LLM_HEDGE_AFTER}초 안에 오지 않아 '{model}'에 헤징 요청을 보냅니다.")
+            pending.add(submit())
+        raise last_error
+    finally:
+        if pending:
+            for future in pending:
+                cancels[future].set()
+            # 슬롯을 기다리던 요청이 취소를 바로 알아차리도록 깨웁니다.
+            get_model_limiter(model).wake()
+
+def _complete_with_retry(model: str, messages: list, on_wait, deadline: float, labels: dict, response_format: dict = None) -> tuple:
+    """재시도와 대체 모델 전환을 적용해 (응답 텍스트, 실제로 응답한 모델)을 얻습니다. 모두 실패하면 마지막 오류를 발생시킵니다."""
+    last_error = None
+    for candidate in _model_candidates(model):
+        if candidate != model:
+            print(f"'{model}' 호출에 실패하여 대체 모델 '{candidate}'(으)로 전환합니다.")
+        for attempt in range(LLM_MAX_RETRIES + 1):
+            try:
+                return _complete_hedged(candidate, messages, on_wait, deadline, labels, response_format), candidate
+            except (DeadlineExceeded, CallCancelled):
+                raise
+            except Exception as e:
+                last_error = e
+                print(f"LLM API 호출 중 오류 발생: {e}")
+                if not _backoff_before_retry(e, attempt, deadline):
+                    break
+    raise last_error
+
+def call_llm(prompt: str, chat_history: list, model: str, stream: bool = False, on_wait=None, deadline: float = None,
+             response_format: dict = None, on_model=None):
+    """Together.ai API를 호출하고, 실패 시 오류 메시지를 반환하며 대화 히스토리를 유지합니다.
+    stream=True이면 지금까지 누적된 응답 텍스트를 차례로 내보내는 제너레이터를 반환합니다.
+    모델별 호출 제한에 걸려 기다리는 동안에는 on_wait(대기 순번)이 호출됩니다.
+    일시적인 오류는 재시도하고 대체 모델로 전환하며, 모든 시도는 deadline(time.monotonic 기준)까지로 제한됩니다.
+    response_format이 주어지면 JSON 스키마에 맞춘 응답을 요청합니다.
+    on_model이 주어지면 실제로 응답한 모델 ID(대체 모델일 수 있음)를 전달합니다 (stream=False일 때만)."""
     chat_history.append({"role": "user", "content": prompt})
+    # 토큰 사용량은 호출한 단계의 라벨(단계, 언어)로 집계합니다.
+    labels = current_stage_labels()
+    if stream:
+        return _stream_llm(chat_history, model, on_wait, deadline, labels, response_format)
     try:
-        response = client.chat.completions.create(
-            model=model,
-            messages=chat_history,
-        )
-        if response.choices and response.choices[0].message.content:
-            reply = response.choices[0].message.content.strip()
+        reply, answered_by = _complete_with_retry(model, chat_history, on_wait, deadline, labels, response_format)
+        if on_model:
+            on_model(answered_by)
+        if reply:
             chat_history.append({"role": "assistant", "content": reply})
             return reply
         else:
@@ -302,13 +2285,212 @@ def call_llm(prompt: str, chat_history: list, model: str) -> str:
         print(f"LLM API 호출 중 오류 발생: {e}")
         return f"Error: LLM API call failed. ({e})"
 
+# 같은 캐시 키로 동시에 들어온 요청은 먼저 시작한 호출의 결과를 함께 사용합니다.
+_stage_inflight = {}
+_stage_inflight_lock = threading.Lock()
+
+def call_llm_cached(cache_key: str, prompt: str, chat_history: list, model: str, on_wait=None, deadline: float = None,
+                    response_format: dict = None, validate=None) -> str:
+    """캐시에 결과가 있으면 LLM을 호출하지 않고 반환하며, 없으면 호출 후 성공한 결과만 저장합니다.
+    같은 키의 호출이 이미 진행 중이면 새로 호출하지 않고 그 결과를 기다립니다.
+    validate(응답)가 오류 설명을 반환하면 그 응답은 실패로 처리해 "Error: ..."를 반환하고 캐시에 저장하지 않습니다."""
+    cached = stage_cache.get(cache_key)
+    own_call = None
+    if cached is None:
+        with _stage_inflight_lock:
+            inflight = _stage_inflight.get(cache_key)
+            if inflight is None:
+                own_call = _stage_inflight[cache_key] = Future()
+        if inflight is not None:
+            try:
+                reply = inflight.result(timeout=_remaining(deadline))
+            except FutureTimeoutError:
+                reply = "Error: LLM API call failed. (deadline exceeded while waiting for a shared result)"
+                chat_history.append({"role": "user", "content": prompt})
+                return reply
+            # 먼저 시작한 호출이 실패했다면 직접 다시 호출합니다.
+            if not (reply.startswith("오류") or reply.startswith("Error")):
+                cached = reply
+    if cached is not None:
+        chat_history.append({"role": "user", "content": prompt})
+        chat_history.append({"role": "assistant", "content": cached})
+        return cached
+
+    reply = "Error: LLM API call failed."
+    try:
+        answered_by = []
+        reply = call_llm(prompt, chat_history, model, on_wait=on_wait, deadline=deadline, response_format=response_format,
+                         on_model=answered_by.append)
+        error = None
+        if validate is not None and not (reply.startswith("오류") or reply.startswith("Error")):
+            error = validate(reply)
+            if error:
+                print(f"LLM 응답 형식 오류: {error}")
+                reply = f"Error: LLM returned an invalid response. ({error})"
+        if answered_by and answered_by[0] != model:
+            # 캐시 키는 기본 모델 기준이므로, 대체 모델의 응답을 저장하면 이후 요청이 모두 대체 모델 결과를 받게 됩니다.
+            print(f"대체 모델 '{answered_by[0]}'의 응답은 단계 결과 캐시에 저장하지 않습니다.")
+        elif not (reply.startswith("오류") or reply.startswith("Error")):
+            stage_cache.set(cache_key, reply)
+    finally:
+        if own_call is not None:
+            with _stage_inflight_lock:
+                del _stage_inflight[cache_key]
+            own_call.set_result(reply)
+    return reply
+
+def _stream_llm(chat_history: list, model: str, on_wait=None, deadline: float = None, labels: dict = None,
+                response_format: dict = None):
+    """토큰 단위로 응답을 받아 STREAM_FLUSH_INTERVAL 간격으로 누적 텍스트를 내보냅니다.
+    첫 토큰은 즉시 내보내며, 마지막 값은 완성된 응답 또는 오류 메시지입니다.
+    재시도와 대체 모델 전환은 첫 토큰을 받기 전까지만 적용됩니다."""
+    reply = ""
+    last_flush = 0.0
+    last_error = None
+    for candidate in _model_candidates(model):
+        if candidate != model:
+            print(f"'{model}' 호출에 실패하여 대체 모델 '{candidate}'(으)로 전환합니다.")
+        for attempt in range(LLM_MAX_RETRIES + 1):
+            try:
+                with get_model_limiter(candidate).slot(on_wait, deadline):
+                    on_usage = lambda usage, candidate=candidate: record_token_usage(candidate, labels or {}, usage)
+                    for delta in get_llm_backend().stream(candidate, chat_history, on_usage=on_usage,
+                                                          response_format=response_format, deadline=deadline):
+                        if _remaining(deadline) == 0:
+                            raise DeadlineExceeded("deadline exceeded while streaming the LLM response")
+                        reply += delta
+                        now = time.monotonic()
+                        if now - last_flush >= STREAM_FLUSH_INTERVAL:
+                            last_flush = now
+                            yield reply
+                last_error = None
+                break
+            except Exception as e:
+                last_error = e
+                print(f"LLM API 호출 중 오류 발생: {e}")
+                # 이미 일부 응답을 보여준 뒤에는 다시 시도하지 않습니다.
+                if reply or not _backoff_before_retry(e, attempt, deadline):
+                    break
+        if last_error is None or reply or isinstance(last_error, DeadlineExceeded):
+            break
+
+    if last_error is not None:
+        yield f"Error: LLM API call failed. ({last_error})"
+        return
+
+    reply = reply.strip()
+    if not reply:
+        print("Warning: LLM returned an empty response.")
+        yield "Error: LLM returned an empty response."
+        return
+    chat_history.append({"role": "assistant", "content": reply})
+    yield reply
+
+# 단계가 끝날 때마다 listener(단계 이름, 소요 시간(초), 라벨)이 호출됩니다. 벤치마크 등에서 등록해 사용합니다.
+stage_listeners = [
+    lambda stage_name, seconds, labels: stage_duration_seconds.observe(
+        seconds, stage=stage_name, lang=labels.get("lang", "-"), model=labels.get("model", "-")
+    ),
+]
+
+def _timed_stage(stage_name: str, labels: dict, fn, *args):
+    """단계 함수를 실행하고 소요 시간을 stage_listeners에 알립니다. 실행 중에는 스레드에 단계 라벨을 기록합니다."""
+    _stage_context.labels = dict(labels, stage=stage_name)
+    start = time.perf_counter()
+    try:
+        return fn(*args)
+    finally:
+        elapsed = time.perf_counter() - start
+        del _stage_context.labels
+        for listener in stage_listeners:
+            listener(stage_name, elapsed, labels)
+
+def run_stages(stages: dict, progress: queue.Queue = None, labels: dict = None, executor: ThreadPoolExecutor = None):
+    """독립적인 단계들을 스레드 풀(기본값 stage_executor)에서 동시에 실행하고, 완료되는 순서대로 (단계 이름, 결과)를 반환하는 제너레이터입니다.
+    stages의 값은 (함수, 인자) 또는 단계별 라벨을 더한 (함수, 인자, 라벨)입니다.
+    progress 대기열이 주어지면 단계가 실행되는 동안 들어온 항목을 (None, 항목)으로 함께 내보냅니다."""
+    labels = labels or {}
+    executor = executor or stage_executor
+    futures = {
+        executor.submit(_timed_stage, name, dict(labels, **(spec[2] if len(spec) > 2 else {})), spec[0], *spec[1]): name
+        for name, spec in stages.items()
+    }
+    pending = set(futures)
+    try:
+        while pending:
+            if progress is None:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            else:
+                try:
+                    yield None, progress.get(timeout=0.05)
+                    continue
+                except queue.Empty:
+                    pass
+                done, pending = wait(pending, timeout=0, return_when=FIRST_COMPLETED)
+            if done and progress is not None:
+                # 끝난 단계가 마지막으로 넣은 부분 결과를 단계 결과보다 먼저 내보냅니다.
+                # 그래야 늦게 읽힌 부분 결과가 최종 결과를 덮어쓰거나 다음 run_stages 호출로 넘어가지 않습니다.
+                while True:
+                    try:
+                        yield None, progress.get_nowait()
+                    except queue.Empty:
+                        break
+            for future in done:
+                yield futures[future], future.result()
+    finally:
+        # 중간에 실패해 제너레이터가 닫히면 아직 시작되지 않은 단계는 취소합니다.
+        for future in futures:
+            future.cancel()
+
+def stream_llm_to_queue(prompt: str, chat_history: list, model: str, progress: queue.Queue, on_wait=None,
+                        deadline: float = None, part=None, response_format: dict = None) -> str:
+    """스트리밍 응답을 작업 스레드에서 받아 부분 결과를 ("partial", 텍스트, part)로 progress 대기열에 넣고, 최종 응답을 반환합니다.
+    part는 여러 스트림을 동시에 받을 때 어느 스트림의 결과인지 구분하는 값입니다."""
+    reply = ""
+    for reply in call_llm(prompt, chat_history, model, stream=True, on_wait=on_wait, deadline=deadline,
+                          response_format=response_format):
+        progress.put(("partial", reply, part))
+    return reply
+
         
 # 이 함수를 새로 추가하세요.
-def handle_upload(pdf_file, lang_key):
+def handle_upload(pdf_file, lang_key, request: gr.Request = None):
+    """업로드된 파일을 업로드 저장소로 옮기고, 세션 상태에는 업로드 id만 보관합니다."""
     T = LANG_STRINGS[lang_key]
-    if pdf_file:
-        return T['upload_success'], pdf_file
-    return "", None
+    if not pdf_file:
+        return "", None
+    source_path = getattr(pdf_file, "name", pdf_file)
+    # Gradio 캐시 파일은 내용 기반 경로라 같은 PDF를 올린 다른 세션과 공유될 수 있으므로 복사만 하고 지우지 않습니다.
+    try:
+        upload_id = upload_store.add(source_path, os.path.basename(source_path), request.session_hash if request else None)
+    except ValueError:
+        return T['error_upload_too_large'].format(max_mb=UPLOAD_MAX_MB), None
+    except OSError as e:
+        print(f"업로드 파일 저장 실패: {e}")
+        return T['error_upload_failed'], None
+    return T['upload_success'], upload_id
+
+def build_step12_stages(T: dict, lang: str, company_name: str, job_title: str, num_interviewers, model: str,
+                        on_wait=None, deadline: float = None) -> dict:
+    """1단계(회사/직무 정보)와 2단계(면접관 페르소나)의 run_stages 단계 정의를 만듭니다.
+    생성 요청과 미리 실행이 같은 프롬프트와 캐시 키를 사용하므로, 미리 실행한 결과를 생성 요청이 그대로 이어받습니다."""
+    num_interviewers = int(num_interviewers)
+    # 동시에 실행되는 호출이 같은 리스트를 수정하지 않도록 단계별로 대화 히스토리를 분리합니다.
+    context_history, prompt_context = build_prompt(T, 'prompt_context', company_name=company_name, job_title=job_title)
+    persona_history, prompt_personas = build_prompt(
+        T, 'prompt_personas_json' if STRUCTURED_OUTPUT else 'prompt_personas', input_key='prompt_personas_input',
+        company_name=company_name, job_title=job_title, num_interviewers=num_interviewers
+    )
+    context_key = make_cache_key("context", lang, company_name, job_title, model)
+    personas_key = make_cache_key("personas", lang, company_name, job_title, model, num_interviewers, STRUCTURED_OUTPUT)
+    personas_args = (personas_key, prompt_personas, persona_history, model, on_wait, deadline)
+    if STRUCTURED_OUTPUT:
+        # JSON 스키마에 맞지 않는 응답은 실패로 처리해 캐시에 넣지 않습니다.
+        personas_args += (personas_response_format(num_interviewers), lambda reply: parse_structured_reply(reply, "personas")[1])
+    return {
+        "context": (call_llm_cached, (context_key, prompt_context, context_history, model, on_wait, deadline), {"model": model}),
+        "personas": (call_llm_cached, personas_args, {"model": model}),
+    }
 
 # --- [수정된 메인 함수] ---
 def generate_interview_questions(company_name, job_title, pdf_file_obj, num_interviewers, questions_per_interviewer, lang):
@@ -318,94 +2500,428 @@ def generate_interview_questions(company_name, job_title, pdf_file_obj, num_inte
     T = LANG_STRINGS[lang]
     model = MODELS[lang]
     llama_model_name = LLAMA_MODEL_ID[lang]
+    # 재시도와 대체 모델 호출을 포함한 모든 LLM 호출은 이 시각까지 끝나야 합니다.
+    deadline = time.monotonic() + RUN_DEADLINE
 
 
     if not all([company_name, job_title, pdf_file_obj]):
         yield T['error_all_fields']
         return
-        
-    pdf_path = pdf_file_obj.name
-    if not pdf_path.lower().endswith(".pdf"):
+
+    if hasattr(pdf_file_obj, "name"):
+        # 배치 처리와 벤치마크는 파일 경로(.name)를 가진 객체를 넘깁니다.
+        original_filename = os.path.basename(pdf_file_obj.name)
+        upload_id = None
+    else:
+        # 웹 UI는 업로드 저장소의 id를 넘깁니다.
+        upload_id = pdf_file_obj
+        upload = upload_store.get(upload_id)
+        if upload is None:
+            yield T['error_upload_expired']
+            return
+        original_filename = upload.name
+    if not original_filename.lower().endswith(".pdf"):
         yield T['error_not_pdf']
         return
 
+    if upload_id is None:
+        try:
+            if os.path.getsize(pdf_file_obj.name) > UPLOAD_MAX_MB * 1024 * 1024:
+                yield T['error_upload_too_large'].format(max_mb=UPLOAD_MAX_MB)
+                return
+            with open(pdf_file_obj.name, 'rb') as file:
+                pdf_bytes = file.read()
+        except FileNotFoundError:
+            yield f"PDF Processing Failed: 오류: PDF 파일을 찾을 수 없습니다. 경로: {pdf_file_obj.name}"
+            return
+        pdf_digest = hashlib.sha256(pdf_bytes).hexdigest()
+    else:
+        pdf_bytes, pdf_digest = upload.read(), upload.digest
+        if pdf_bytes is None:
+            yield T['error_upload_expired']
+            return
+
     if GCS_BUCKET_NAME:
-        original_filename = os.path.basename(pdf_file_obj.name)
         unique_id = str(uuid.uuid4().hex)[:8]
         timestamp = time.strftime("%Y%m%d-%H%M%S")
         destination_blob_name = f"{timestamp}-{unique_id}-{original_filename}"
-        upload_to_gcs(GCS_BUCKET_NAME, pdf_path, destination_blob_name)
+        # 업로드는 백그라운드에서 처리되므로 요청 처리가 스토리지를 기다리지 않습니다.
+        upload_to_gcs(GCS_BUCKET_NAME, pdf_bytes, destination_blob_name)
 
-    output_log = ""
-    resume_text = extract_text_from_pdf(pdf_path)
-    if resume_text.startswith("오류") or resume_text.startswith("Error"):
-        yield f"PDF Processing Failed: {resume_text}"
+    run_id = make_run_id(
+        lang, company_name, job_title, num_interviewers, questions_per_interviewer,
+        model, llama_model_name, SUMMARY_MODE, STRUCTURED_OUTPUT, pdf_digest
+    )
+    checkpoint = checkpoint_store.get(run_id) or {}
+    if "final_output" in checkpoint:
+        # 같은 요청이 이미 끝까지 완료되었으면 저장된 결과를 바로 반환합니다.
+        yield checkpoint["final_output"]
         return
 
-    output_log += T['log_step1_start'] + "\n"
+    # PDF 추출, 1단계, 2단계는 서로 독립적이므로 동시에 실행합니다.
+    output_log = T['log_step1_start'] + "\n" + T['log_step2_start'] + "\n"
+    if checkpoint:
+        output_log = T['log_resumed'] + output_log
     yield output_log
-    
-    prompt_context = T['prompt_context'].format(company_name=company_name, job_title=job_title)
-    chat_history = []
-    context_info = call_llm(prompt_context, chat_history, model)
-    if context_info.startswith("오류") or context_info.startswith("Error"):
-        yield output_log + T['log_step1_fail'] + context_info
-        return
-    output_log += T['log_step1_done']
-    yield output_log
-    time.sleep(1)
 
-    output_log += T['log_step2_start'] + "\n"
-    yield output_log
-    
-    prompt_personas = T['prompt_personas'].format(company_name=company_name, job_title=job_title, num_interviewers=num_interviewers)
-    interviewer_personas = call_llm(prompt_personas, chat_history, model)
-    if interviewer_personas.startswith("오류") or interviewer_personas.startswith("Error"):
-        yield output_log + T['log_step2_fail'] + interviewer_personas
-        return
-    output_log += T['log_step2_done']
-    yield output_log
-    time.sleep(1)
+    # LLM 호출 제한으로 대기하는 동안 작업 스레드가 대기 순번을 progress 대기열에 넣습니다.
+    progress = queue.Queue()
+    def on_wait(position):
+        progress.put(("queue", T['log_queue_position'].format(position=position)))
+
+    # 1, 2단계를 미리 실행 중이거나 끝냈다면 call_llm_cached가 그 결과를 기다리거나 캐시에서 바로 반환합니다.
+    stages = {"pdf": (extract_text_cached, (pdf_bytes, pdf_digest))}
+    stages.update(build_step12_stages(T, lang, company_name, job_title, num_interviewers, model, on_wait, deadline))
+    # 체크포인트에 저장된 단계는 다시 실행하지 않습니다 (pdf 단계의 결과는 압축된 이력서 "resume"으로 저장).
+    results = {}
+    if "resume" in checkpoint:
+        del stages["pdf"]
+    for stage_name in ("context", "personas"):
+        if stage_name in checkpoint:
+            del stages[stage_name]
+            results[stage_name] = checkpoint[stage_name]
+            output_log += T['log_step1_done'] if stage_name == "context" else T['log_step2_done']
+    if len(stages) < 3:
+        yield output_log
+
+    for stage_name, result in run_stages(stages, progress, {"lang": lang}):
+        if stage_name is None:
+            # 대기 순번 안내는 진행 로그에 누적하지 않고 현재 화면에만 표시합니다.
+            yield output_log + result[1]
+            continue
+        if stage_name == "pdf":
+            result, pdf_info = result
+            if pdf_info is None:
+                yield f"PDF Processing Failed: {result}"
+                return
+        elif result.startswith("오류") or result.startswith("Error"):
+            if stage_name == "context":
+                yield output_log + T['log_step1_fail'] + result
+            else:
+                yield output_log + T['log_step2_fail'] + result
+            return
+        results[stage_name] = result
+        if stage_name != "pdf":
+            save_checkpoint(run_id, **{stage_name: result})
+        if stage_name == "pdf" and pdf_info["truncated"]:
+            output_log += T['log_pdf_truncated'].format(
+                pages_read=pdf_info["pages_read"], total_pages=pdf_info["total_pages"],
+                reason=T['pdf_truncate_reasons'][pdf_info["truncated"]]
+            )
+            yield output_log
+        elif stage_name == "context":
+            output_log += T['log_step1_done']
+            yield output_log
+        elif stage_name == "personas":
+            output_log += T['log_step2_done']
+            yield output_log
+
+    if "resume" in checkpoint:
+        resume_text = checkpoint["resume"]
+    else:
+        resume_text, resume_tokens, compact_tokens = compact_resume(
+            results["pdf"], RESUME_TOKEN_BUDGET, company_name.split() + job_title.split()
+        )
+        print(f"이력서 압축: 약 {resume_tokens} → {compact_tokens} 토큰 ({resume_tokens - compact_tokens} 토큰 절감)")
+        save_checkpoint(run_id, resume=resume_text)
+    context_info = results["context"]
+    interviewer_personas = results["personas"]
 
     output_log += T['log_step3_start'] + "\n"
     yield output_log
 
-    prompt_final = T['prompt_final'].format(
-        context_info=context_info,
-        interviewer_personas=interviewer_personas,
-        resume_text=resume_text,
-        questions_per_interviewer=questions_per_interviewer
-    )
-    final_questions_raw = call_llm(prompt_final, chat_history, model)
-    if final_questions_raw.startswith("오류") or final_questions_raw.startswith("Error"):
-        yield output_log + T['log_step3_fail'] + final_questions_raw
-        return
+    if STRUCTURED_OUTPUT:
+        # JSON 페르소나는 면접관별로 정확히 나뉘므로 텍스트 분할(split_personas)이 필요 없습니다.
+        personas, error = parse_structured_reply(interviewer_personas, "personas")
+        if error:
+            yield output_log + T['log_step2_fail'] + f"Error: LLM returned an invalid response. ({error})"
+            return
+        if len(personas) != int(num_interviewers):
+            print(f"경고: 면접관 {int(num_interviewers)}명을 요청했지만 페르소나 {len(personas)}개를 받았습니다.")
+        persona_groups = [[persona] for persona in personas] if STEP3_FANOUT else [personas]
+        persona_blocks = [json.dumps({"personas": group}, ensure_ascii=False, indent=2) for group in persona_groups]
+    else:
+        # 면접관마다 3단계 호출을 따로 보내 동시에 실행합니다. 페르소나를 나누지 못하면 기존처럼 한 번에 호출합니다.
+        persona_blocks = (split_personas(interviewer_personas, num_interviewers) if STEP3_FANOUT else None) or [interviewer_personas]
+    final_questions_raw = checkpoint.get("final", "")
+    if not final_questions_raw:
+        # 면접관별 결과는 완료되는 대로 체크포인트에 저장되므로 재시도 시 남은 면접관만 다시 생성합니다.
+        stage_names = ["final"] if len(persona_blocks) == 1 else [f"final_{index + 1}" for index in range(len(persona_blocks))]
+        parts = [checkpoint.get(stage_name, "") for stage_name in stage_names]
+        step3 = {}
+        for index, (stage_name, persona) in enumerate(zip(stage_names, persona_blocks)):
+            if parts[index]:
+                continue
+            # 1, 2단계 결과는 이전 대화로 다시 보내지 않고 [면접 정보]에 한 번만 넣습니다.
+            chat_history, prompt_final = build_prompt(
+                T, 'prompt_final_json' if STRUCTURED_OUTPUT else 'prompt_final', input_key='prompt_final_input',
+                context_info=context_info,
+                interviewer_personas=persona,
+                resume_text=resume_text,
+                questions_per_interviewer=questions_per_interviewer
+            )
+            response_format = None
+            if STRUCTURED_OUTPUT:
+                response_format = questions_response_format(len(persona_groups[index]), int(questions_per_interviewer))
+            step3[stage_name] = (
+                stream_llm_to_queue, (prompt_final, chat_history, model, progress, on_wait, deadline, index, response_format),
+                {"model": model}
+            )
+        # JSON 응답은 면접관별 파서가 이어서 읽어, 완성된 질문만 면접관 순서대로 표시합니다.
+        parsers = [IncrementalJsonParser() for _ in stage_names]
+        def render_parts():
+            if not STRUCTURED_OUTPUT:
+                return "\n\n".join(part for part in parts if part)
+            interviewers = []
+            for parser, part in zip(parsers, parts):
+                snapshot = parser.feed(part) if part else None
+                if isinstance(snapshot, dict) and isinstance(snapshot.get("interviewers"), list):
+                    interviewers += snapshot["interviewers"]
+            return render_questions(T, interviewers)
+        # 3단계는 토큰이 도착하는 대로 면접관 순서에 맞춰 부분 결과를 화면에 보여줍니다.
+        for stage_name, result in run_stages(step3, progress, {"lang": lang}, executor=step3_executor):
+            if stage_name is None:
+                if result[0] == "partial":
+                    parts[result[2]] = result[1]
+                    yield output_log + render_parts()
+                else:
+                    yield output_log + render_parts() + "\n" + result[1]
+                continue
+            if STRUCTURED_OUTPUT and not (result.startswith("오류") or result.startswith("Error")):
+                error = parse_structured_reply(result, "questions")[1]
+                if error:
+                    print(f"LLM 응답 형식 오류: {error}")
+                    result = f"Error: LLM returned an invalid response. ({error})"
+            if result.startswith("오류") or result.startswith("Error"):
+                yield output_log + T['log_step3_fail'] + result
+                return
+            parts[stage_names.index(stage_name)] = result
+            save_checkpoint(run_id, **{stage_name: result})
+        if STRUCTURED_OUTPUT:
+            # 면접관별 JSON 응답을 하나의 질문 목록으로 합칩니다.
+            interviewers = []
+            for part in parts:
+                interviewers += parse_structured_reply(part, "questions")[0]
+            final_questions_raw = json.dumps({"interviewers": interviewers}, ensure_ascii=False)
+        else:
+            final_questions_raw = "\n\n".join(parts)
+        save_checkpoint(run_id, final=final_questions_raw)
     output_log += T['log_step3_done']
     yield output_log
-    time.sleep(1)
-
-    output_log += T['log_summary_start'] + "\n"
-    yield output_log
 
-    
-    # 💡 여기서 chat_history를 새로 빈 리스트로 초기화
-    chat_history = []
+    summarized_result = None
+    if STRUCTURED_OUTPUT:
+        # 구조화된 결과는 서버에서 바로 표시 형식으로 만들므로 결과 정리(요약) 단계가 필요 없습니다.
+        summarized_result = render_structured_result(
+            T, parse_structured_reply(interviewer_personas, "personas")[0],
+            parse_structured_reply(final_questions_raw, "questions")[0]
+        )
+        _count_summary("structured")
+    else:
+        output_log += T['log_summary_start'] + "\n"
+        yield output_log
+        if SUMMARY_MODE == "local":
+            summarized_result = summarize_locally(lang, interviewer_personas, final_questions_raw)
+            _count_summary("local" if summarized_result is not None else "fallback")
+    if summarized_result is not None:
+        final_result = f"{T['final_result_header']}\n\n{summarized_result}"
+        output_log += T['log_all_done'] + final_result
+        save_checkpoint(run_id, final_output=output_log)
+        yield output_log
+        return
+    _count_summary("llm")
 
     full_content_to_summarize = (
         f"[면접관 페르소나]\n{interviewer_personas}\n\n"
         f"[면접 질문]\n{final_questions_raw}"
     )
-    prompt_real_final = T['prompt_real_final'].format(
-        full_content_to_summarize=full_content_to_summarize
+    # 💡 요약 단계는 이전 대화 없이 새 대화 히스토리로 시작합니다.
+    chat_history, prompt_real_final = build_prompt(
+        T, 'prompt_real_final', full_content_to_summarize=full_content_to_summarize
     )
-    summarized_result = call_llm(prompt_real_final, chat_history, llama_model_name)
-    if summarized_result.startswith("오류") or summarized_result.startswith("Error"):
+    summarized_result = ""
+    summary = {"summary": (stream_llm_to_queue, (prompt_real_final, chat_history, llama_model_name, progress, on_wait, deadline), {"model": llama_model_name})}
+    for stage_name, result in run_stages(summary, progress, {"lang": lang}):
+        if stage_name is None:
+            yield output_log + result[1]
+        else:
+            summarized_result = result
+    summary_failed = summarized_result.startswith("오류") or summarized_result.startswith("Error")
+    if summary_failed:
         summarized_result = T['log_summary_fail']
 
     final_result = f"{T['final_result_header']}\n\n{summarized_result}"
     output_log += T['log_all_done'] + final_result
+    if not summary_failed:
+        # 요약에 실패한 결과는 저장하지 않아 재시도 시 요약 단계만 다시 실행합니다.
+        save_checkpoint(run_id, final_output=output_log)
     yield output_log
 
+# --- [신규] 1, 2단계 미리 실행 ---
+prefetch_executor = ThreadPoolExecutor(max_workers=PREFETCH_WORKERS, thread_name_prefix="prefetch")
+prefetch_stats = {"scheduled": 0, "started": 0, "skipped_busy": 0, "cancelled": 0}
+# 세션(session_hash)별 미리 실행 상태: 입력 키, 디바운스 타이머, 실행 중인 Future 목록
+_prefetch_sessions = {}
+_prefetch_lock = threading.Lock()
+
+def _prefetch_on_wait(position):
+    # 미리 실행은 실제 생성 요청의 호출 순서를 뺏지 않도록, 호출 제한에 걸려 기다려야 하면 중단합니다.
+    raise CallCancelled("prefetch skipped: LLM limiter is busy")
+
+def _cancel_prefetch_state(state):
+    state.timer.cancel()
+    for future in state.futures:
+        future.cancel()
+
+def cancel_prefetch(session_hash):
+    """세션의 미리 실행을 취소합니다. 이미 LLM 호출이 시작된 단계는 끝까지 실행되어 캐시에 남습니다."""
+    with _prefetch_lock:
+        state = _prefetch_sessions.pop(session_hash, None)
+        if state is not None:
+            prefetch_stats["cancelled"] += 1
+            _cancel_prefetch_state(state)
+
+def _start_prefetch(session_hash, key, company_name, job_title, num_interviewers, lang):
+    T = LANG_STRINGS[lang]
+    model = MODELS[lang]
+    stages = build_step12_stages(T, lang, company_name, job_title, num_interviewers, model, _prefetch_on_wait)
+    with _prefetch_lock:
+        state = _prefetch_sessions.get(session_hash)
+        if state is None or state.key != key:
+            return
+        if get_model_limiter(model).stats()["waiting"]:
+            prefetch_stats["skipped_busy"] += 1
+            del _prefetch_sessions[session_hash]
+            return
+        prefetch_stats["started"] += 1
+        labels = {"lang": lang}
+        for name, spec in stages.items():
+            state.futures.append(prefetch_executor.submit(
+                _timed_stage, f"prefetch_{name}", dict(labels, **spec[2]), spec[0], *spec[1]
+            ))
+    # 완료 콜백은 이미 끝난 Future에서는 바로 실행되므로 _prefetch_lock을 놓은 뒤에 등록합니다.
+    for future in state.futures:
+        future.add_done_callback(lambda _, state=state: _finish_prefetch(session_hash, state))
+
+def _finish_prefetch(session_hash, state):
+    """미리 실행한 단계가 모두 끝나면 세션 상태를 지웁니다. 결과는 단계 결과 캐시에 남아 있습니다."""
+    with _prefetch_lock:
+        if _prefetch_sessions.get(session_hash) is state and all(future.done() for future in state.futures):
+            del _prefetch_sessions[session_hash]
+
+def schedule_prefetch(company_name, job_title, num_interviewers, lang, request: gr.Request):
+    """입력이 바뀔 때 호출됩니다. 이전 예약은 취소하고 PREFETCH_DELAY초 뒤에 1, 2단계를 미리 실행하도록 예약합니다."""
+    if request is None:
+        return
+    session_hash = request.session_hash
+    company_name, job_title = (company_name or "").strip(), (job_title or "").strip()
+    if not PREFETCH_ENABLED or not company_name or not job_title or lang not in LANG_STRINGS:
+        cancel_prefetch(session_hash)
+        return
+    key = make_cache_key(lang, company_name, job_title, int(num_interviewers))
+    with _prefetch_lock:
+        state = _prefetch_sessions.get(session_hash)
+        if state is not None and state.key == key:
+            return
+        if state is not None:
+            prefetch_stats["cancelled"] += 1
+            _cancel_prefetch_state(state)
+        timer = threading.Timer(
+            PREFETCH_DELAY, _start_prefetch, (session_hash, key, company_name, job_title, num_interviewers, lang)
+        )
+        timer.daemon = True
+        _prefetch_sessions[session_hash] = SimpleNamespace(key=key, timer=timer, futures=[])
+        prefetch_stats["scheduled"] += 1
+        timer.start()
+
+# --- [신규] 헤드리스 배치 처리 ---
+def run_batch_job(job: dict) -> dict:
+    """배치 작업 하나를 generate_interview_questions로 실행하고 결과를 dict로 반환합니다.
+    job: {"id", "company", "job", "pdf"(경로), "num_interviewers", "questions_per_interviewer", "lang"}"""
+    lang = job.get("lang", "ko")
+    result = {"id": job.get("id"), "company": job.get("company"), "job": job.get("job")}
+    if lang not in LANG_STRINGS:
+        return dict(result, status="error", error=f"unsupported lang: {lang}")
+    T = LANG_STRINGS[lang]
+    # UI 슬라이더와 같은 범위만 허용합니다. 범위를 넘는 작업은 3단계 호출 수가 제한 없이 늘어나므로 거부합니다.
+    counts = {}
+    for key, maximum in (("num_interviewers", MAX_INTERVIEWERS), ("questions_per_interviewer", MAX_QUESTIONS_PER_INTERVIEWER)):
+        try:
+            value = int(job.get(key, 1 if key == "num_interviewers" else 2))
+        except (TypeError, ValueError):
+            value = None
+        if value is None or not 1 <= value <= maximum:
+            return dict(result, status="error", error=f"{key} must be an integer between 1 and {maximum}")
+        counts[key] = value
+    pdf_file_obj = SimpleNamespace(name=job["pdf"]) if job.get("pdf") else None
+    start = time.perf_counter()
+    output = ""
+    try:
+        for output in generate_interview_questions(
+            job.get("company"),
+            job.get("job"),
+            pdf_file_obj,
+            counts["num_interviewers"],
+            counts["questions_per_interviewer"],
+            lang,
+        ):
+            pass
+    except Exception as e:
+        output = f"Error: {e}"
+    result["seconds"] = round(time.perf_counter() - start, 3)
+    if T['log_all_done'] in output:
+        return dict(result, status="ok", result=output.split(T['log_all_done'], 1)[1])
+    return dict(result, status="error", error=output)
+
+def run_batch(jobs, workers: int = BATCH_WORKERS):
+    """여러 작업을 제한된 워커 풀에서 실행하고 끝나는 순서대로 결과를 내보냅니다. 결과의 index는 입력 순서입니다.
+    같은 회사/직무의 1, 2단계 결과는 단계 캐시와 진행 중 호출 공유(call_llm_cached) 덕분에 한 번만 생성됩니다."""
+    yield from _run_batch_jobs(run_batch_job, jobs, workers)
+
+def _run_batch_jobs(run_job, jobs, workers: int):
+    """작업마다 run_job을 실행하고 끝나는 순서대로 결과를 내보냅니다.
+    잘못된 작업이나 예외는 그 작업만 {"status": "error"} 결과로 바꾸므로 나머지 작업의 결과 스트림은 계속됩니다."""
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="batch") as executor:
+        futures = {}
+        for index, job in enumerate(jobs):
+            if not isinstance(job, dict):
+                yield {"index": index, "status": "error", "error": "job must be a JSON object"}
+                continue
+            futures[executor.submit(run_job, job)] = index
+        for future in as_completed(futures):
+            try:
+                result = future.result()
+            except Exception as e:
+                result = {"status": "error", "error": f"{type(e).__name__}: {e}"}
+            yield dict(result, index=futures[future])
+
+def _run_uploaded_batch_job(job: dict) -> dict:
+    """API로 받은 작업(pdf_base64)을 임시 파일에 저장해 실행하고, 끝나면 임시 파일을 지웁니다."""
+    job = dict(job)
+    job.pop("pdf", None)  # API에서는 서버의 파일 경로를 읽지 않습니다.
+    pdf_data = job.pop("pdf_base64", None)
+    pdf_name = job.get("pdf_name") or "resume.pdf"
+    result = {"id": job.get("id"), "company": job.get("company"), "job": job.get("job"), "status": "error"}
+    if not isinstance(pdf_name, str):
+        return dict(result, error="pdf_name must be a string")
+    if not pdf_data:
+        return run_batch_job(job)
+    if not isinstance(pdf_data, str):
+        return dict(result, error="pdf_base64 must be a string")
+    try:
+        pdf_bytes = base64.b64decode(pdf_data, validate=True)
+    except (binascii.Error, ValueError) as e:
+        return dict(result, error=f"invalid pdf_base64: {e}")
+    with tempfile.TemporaryDirectory(prefix="fasthire-batch-") as directory:
+        job["pdf"] = os.path.join(directory, os.path.basename(pdf_name) or "resume.pdf")
+        with open(job["pdf"], "wb") as file:
+            file.write(pdf_bytes)
+        return run_batch_job(job)
+
+def run_uploaded_batch(jobs, workers: int = BATCH_WORKERS):
+    """run_batch와 같지만 각 작업의 PDF를 pdf_base64로 받습니다."""
+    yield from _run_batch_jobs(_run_uploaded_batch_job, jobs, workers)
+
 # --- [수정된 UI 언어 변경 함수] ---
 def update_ui_language(lang_choice, current_file):
     lang_key = 'en' if lang_choice == 'English' else 'ko'
@@ -439,20 +2955,114 @@ def update_ui_language(lang_choice, current_file):
         gr.update(value=f'<div lang="{lang_key}">{T["contact_html"]}</div>'),
         gr.update(value=updated_live_users_html)
     )
-# --- 실시간 접속자 수 업데이트 함수 ---
-def update_live_users(lang_choice):
-    lang_key = 'en' if lang_choice == 'English' else 'ko'
+# --- [신규] 실시간 접속자 수 ---
+class LiveSessionTracker:
+    """Gradio 세션(session_hash)의 접속/종료를 기록해 실제 접속 중인 세션 수를 셉니다."""
+
+    def __init__(self, stale_after: float = 0):
+        # stale_after초 동안 소식이 없는 세션은 종료 이벤트를 놓친 것으로 보고 제외합니다 (0이면 사용 안 함).
+        self.stale_after = stale_after
+        self._last_seen = {}
+        self._lock = threading.Lock()
+
+    def touch(self, session_hash):
+        if session_hash:
+            with self._lock:
+                self._last_seen[session_hash] = time.monotonic()
+
+    def remove(self, session_hash):
+        with self._lock:
+            self._last_seen.pop(session_hash, None)
+
+    def count(self) -> int:
+        with self._lock:
+            if self.stale_after:
+                cutoff = time.monotonic() - self.stale_after
+                for session_hash in [h for h, seen in self._last_seen.items() if seen < cutoff]:
+                    del self._last_seen[session_hash]
+            return len(self._last_seen)
+
+class SqliteLiveSessionTracker(LiveSessionTracker):
+    """접속 중인 세션을 sqlite에 기록해 모든 워커 프로세스의 세션을 함께 셉니다."""
+
+    def __init__(self, path: str, stale_after: float = 0):
+        super().__init__(stale_after)
+        self._conn = connect_shared_db(path)
+        self._conn.execute("CREATE TABLE IF NOT EXISTS live_sessions (session_hash TEXT PRIMARY KEY, last_seen REAL NOT NULL)")
+        self._conn.commit()
+
+    def touch(self, session_hash):
+        if session_hash:
+            with self._lock, self._conn:
+                self._conn.execute("INSERT OR REPLACE INTO live_sessions (session_hash, last_seen) VALUES (?, ?)",
+                                   (session_hash, time.time()))
+
+    def remove(self, session_hash):
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM live_sessions WHERE session_hash = ?", (session_hash,))
+
+    def count(self) -> int:
+        with self._lock, self._conn:
+            if self.stale_after:
+                self._conn.execute("DELETE FROM live_sessions WHERE last_seen < ?", (time.time() - self.stale_after,))
+            return self._conn.execute("SELECT COUNT(*) FROM live_sessions").fetchone()[0]
+
+    def reset(self):
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM live_sessions")
+
+if SHARED_STATE_DB:
+    live_sessions = SqliteLiveSessionTracker(SHARED_STATE_DB, stale_after=LIVE_USERS_POLL_SEC * 3)
+else:
+    live_sessions = LiveSessionTracker(stale_after=LIVE_USERS_POLL_SEC * 3)
+
+def render_live_users(lang_key: str, user_count: int) -> str:
     T = LANG_STRINGS[lang_key]
-    user_count = int(np.random.normal(loc=170, scale=30))
     live_user_text = T['live_users'].format(user_count=user_count)
     # lang 속성으로 감싸서 반환
-    html_content = f"""
+    return f"""
     <div lang="{lang_key}" style="display: flex; align-items: center; justify-content: flex-end;">
         <span class="green-dot"></span>
         <span>{live_user_text}</span>
     </div>
     """
-    return html_content
+
+# 언어별로 미리 만들어 둔 접속자 수 HTML. 갱신 스레드가 딕셔너리를 통째로 교체하므로 읽을 때 잠금이 필요 없습니다.
+live_users_html = {lang_key: render_live_users(lang_key, 0) for lang_key in LANG_STRINGS}
+
+def refresh_live_users():
+    """현재 접속자 수로 언어별 HTML을 다시 만듭니다."""
+    global live_users_html
+    user_count = live_sessions.count()
+    live_users_html = {lang_key: render_live_users(lang_key, user_count) for lang_key in LANG_STRINGS}
+
+def _live_users_refresher():
+    while True:
+        time.sleep(LIVE_USERS_REFRESH_SEC)
+        try:
+            refresh_live_users()
+        except Exception as e:
+            print(f"접속자 수 갱신 실패: {e}")
+
+threading.Thread(target=_live_users_refresher, name="live-users", daemon=True).start()
+
+# --- 실시간 접속자 수 업데이트 함수 ---
+def update_live_users(lang_choice, request: gr.Request = None):
+    """미리 만들어 둔 접속자 수 HTML을 반환합니다. 요청한 세션은 접속 중으로 기록합니다."""
+    if request is not None:
+        live_sessions.touch(request.session_hash)
+    lang_key = 'en' if lang_choice == 'English' else 'ko'
+    return live_users_html[lang_key]
+
+def on_session_start(request: gr.Request):
+    live_sessions.touch(request.session_hash)
+    refresh_live_users()
+    return live_users_html['ko']
+
+def on_session_end(request: gr.Request):
+    live_sessions.remove(request.session_hash)
+    cancel_prefetch(request.session_hash)
+    upload_store.remove_session(request.session_hash)
 
 
 # --- Gradio UI 구성 ---
@@ -488,11 +3098,18 @@ css = """
 </style>
 """
 
+startup_timings["module init"] = time.perf_counter() - _module_init_start
+_build_ui_start = time.perf_counter()
+
+# analytics_enabled=False: UI 구성과 시작 과정에서 Gradio 사용 통계 전송 같은 네트워크 작업을 하지 않습니다.
 with gr.Blocks(
     css=css,
     title="FastHire | 합성 면접관에게 진짜 면접 받기",
     theme=gr.themes.Soft(),
-    head=ga_script_html
+    head=ga_script_html,
+    analytics_enabled=False,
+    # 업로드 저장소로 복사한 뒤에는 Gradio 캐시 파일이 필요 없으므로 UPLOAD_TTL이 지나면 지웁니다.
+    delete_cache=(GRADIO_CACHE_CLEANUP_INTERVAL, int(UPLOAD_TTL))
 ) as demo:
     lang_state = gr.State(value="ko")
     pdf_file_state = gr.State(value=None)
@@ -506,7 +3123,7 @@ with gr.Blocks(
             </div>
         ''')
         with gr.Column(elem_id="right_header_container", scale=0):
-            live_users = gr.HTML(update_live_users("한국어"))
+            live_users = gr.HTML(live_users_html['ko'])
             lang_selector = gr.Radio(
                 ["한국어", "English"],
                 value="한국어",
@@ -515,7 +3132,8 @@ with gr.Blocks(
                 interactive=True,
             )
 
-    timer = gr.Timer(7)
+    # 접속자 수 표시는 서버의 캐시된 문자열만 가져가므로 대기열을 거치지 않습니다.
+    timer = gr.Timer(LIVE_USERS_POLL_SEC or 1, active=LIVE_USERS_POLL_SEC > 0)
     subtitle_html = gr.HTML(f'<div lang="ko">{LANG_STRINGS["ko"]["subtitle"]}</div>')
 
     # 입력 블록은 기존대로, 텍스트 출력은 lang 속성을 함께 지정
@@ -524,8 +3142,8 @@ with gr.Blocks(
         job_title = gr.Textbox(label=LANG_STRINGS['ko']['job_label'], placeholder=LANG_STRINGS['ko']['job_placeholder'])
 
     with gr.Row():
-        num_interviewers = gr.Slider(label=LANG_STRINGS['ko']['interviewer_count_label'], minimum=1, maximum=2, value=1, step=1)
-        questions_per_interviewer = gr.Slider(label=LANG_STRINGS['ko']['question_count_label'], minimum=1, maximum=3, value=2, step=1)
+        num_interviewers = gr.Slider(label=LANG_STRINGS['ko']['interviewer_count_label'], minimum=1, maximum=MAX_INTERVIEWERS, value=1, step=1)
+        questions_per_interviewer = gr.Slider(label=LANG_STRINGS['ko']['question_count_label'], minimum=1, maximum=MAX_QUESTIONS_PER_INTERVIEWER, value=2, step=1)
 
     pdf_file = gr.UploadButton(
         LANG_STRINGS['ko']['upload_button_label'],
@@ -562,17 +3180,186 @@ with gr.Blocks(
     timer.tick(
         fn=update_live_users,
         inputs=[lang_selector],
-        outputs=[live_users]
+        outputs=[live_users],
+        queue=False,
+        show_api=False
     )
 
+    # 세션 시작/종료로 실제 접속자 수를 셉니다.
+    demo.load(fn=on_session_start, outputs=[live_users], queue=False, show_api=False)
+    demo.unload(on_session_end)
+
+    # 입력이 바뀌면 1, 2단계 미리 실행을 (디바운스하여) 다시 예약합니다. 화면은 바꾸지 않으므로 대기열을 거치지 않습니다.
+    for prefetch_trigger in (company_name, job_title, num_interviewers, lang_state):
+        prefetch_trigger.change(
+            fn=schedule_prefetch,
+            inputs=[company_name, job_title, num_interviewers, lang_state],
+            outputs=None,
+            queue=False,
+            show_progress="hidden",
+            trigger_mode="always_last",
+            show_api=False
+        )
+
     generate_button.click(
         fn=generate_interview_questions,
         inputs=[company_name, job_title, pdf_file_state, num_interviewers, questions_per_interviewer, lang_state],
-        outputs=output_textbox
+        outputs=output_textbox,
+        concurrency_limit=GENERATE_CONCURRENCY
     )
 
+# 생성 요청의 동시 실행 수는 LLM 호출 제한과 맞추고, 그 이상은 Gradio 대기열에서 기다립니다.
+demo.queue(max_size=GRADIO_QUEUE_SIZE)
+startup_timings["build ui"] = time.perf_counter() - _build_ui_start
+
+# --- [신규] /metrics 엔드포인트 ---
+def render_metrics() -> str:
+    """단계별 소요 시간, 토큰 사용량, 캐시/결과 정리/업로드/호출 제한 상태를 Prometheus 텍스트 형식으로 반환합니다."""
+    lines = stage_duration_seconds.render() + llm_tokens_total.render()
+    caches = {"stage": stage_cache.stats(), "pdf": pdf_cache.stats(), "checkpoint": checkpoint_store.stats()}
+    lines += _render_samples("fasthire_cache_hits_total", "counter", "Cache hits",
+                             [({"cache": name}, stats["hits"]) for name, stats in caches.items()])
+    lines += _render_samples("fasthire_cache_misses_total", "counter", "Cache misses",
+                             [({"cache": name}, stats["misses"]) for name, stats in caches.items()])
+    lines += _render_samples("fasthire_cache_entries", "gauge", "Entries currently held in each cache",
+                             [({"cache": name}, stats["size"]) for name, stats in caches.items()])
+    lines += _render_samples("fasthire_summary_total", "counter", "Summary stage runs by mode",
+                             [({"mode": mode}, count) for mode, count in summary_stats.items()])
+    lines += _render_samples("fasthire_upload_bytes", "gauge", "Bytes of uploaded PDFs currently held",
+                             [({"storage": storage}, held) for storage, held in upload_store.bytes_held().items()])
+    lines += _render_samples("fasthire_upload_files", "gauge", "Uploaded PDFs currently held",
+                             [({"storage": storage}, held) for storage, held in upload_store.files_held().items()])
+    lines += _render_samples("fasthire_upload_events_total", "counter", "Upload store events",
+                             [({"event": event}, count) for event, count in upload_store.stats.items()])
+    lines += _render_samples("fasthire_prefetch_total", "counter", "Speculative step 1/2 prefetch events",
+                             [({"event": event}, count) for event, count in prefetch_stats.items()])
+    if gcs_uploader is not None:
+        lines += _render_samples("fasthire_gcs_uploads_total", "counter", "Background GCS upload events",
+                                 [({"event": event}, count) for event, count in gcs_uploader.stats.items()])
+    limiter_stats = {model: limiter.stats() for model, limiter in list(_model_limiters.items())}
+    lines += _render_samples("fasthire_llm_in_flight", "gauge", "LLM requests currently in flight",
+                             [({"model": model}, stats["in_flight"]) for model, stats in limiter_stats.items()])
+    lines += _render_samples("fasthire_llm_waiting", "gauge", "LLM requests waiting for a limiter slot",
+                             [({"model": model}, stats["waiting"]) for model, stats in limiter_stats.items()])
+    backend = _llm_backend
+    if isinstance(backend, AsyncTogetherBackend):
+        lines += _render_samples("fasthire_llm_pool_size", "gauge", "Connections in the shared LLM client pool",
+                                 [({}, backend.pool_size)])
+        lines += _render_samples("fasthire_llm_pool_in_use", "gauge", "LLM requests currently holding a pooled connection",
+                                 [({}, backend.in_use)])
+        lines += _render_samples("fasthire_llm_pool_waiting", "gauge", "LLM requests waiting for a free pooled connection",
+                                 [({}, backend.waiting)])
+        lines += _render_samples("fasthire_llm_pool_requests_total", "counter", "LLM requests sent through the shared pool",
+                                 [({"event": event}, count) for event, count in backend.stats.items()])
+    lines += _render_samples("fasthire_live_sessions", "gauge", "Active Gradio sessions",
+                             [({}, live_sessions.count())])
+    lines += _render_samples("fasthire_startup_seconds", "gauge", "Cold start duration by phase",
+                             [({"phase": phase}, seconds) for phase, seconds in startup_timings.items()])
+    return "\n".join(lines) + "\n"
+
+def create_server_app(with_ui: bool = True):
+    """Gradio UI와 /metrics, (BATCH_API_TOKEN이 설정된 경우) /api/batch 엔드포인트를 함께 제공하는 FastAPI 앱을 생성합니다.
+    with_ui가 False이면 Gradio UI 없이 /metrics와 /api/batch만 제공합니다."""
+    from fastapi import FastAPI, HTTPException, Request
+    from fastapi.responses import PlainTextResponse, StreamingResponse
+
+    @asynccontextmanager
+    async def lifespan(app):
+        # 앱 시작(lifespan) 시점까지의 시간입니다. 단일 프로세스 모드에서는 소켓을 연 뒤 "time to listening"이 따로 기록됩니다.
+        print(startup_report("time to app startup"))
+        # 요청 처리를 막지 않도록 LLM 연결 워밍업은 백그라운드에서 진행합니다.
+        threading.Thread(target=warm_up_llm_backend, name="llm-warm-up", daemon=True).start()
+        yield
+
+    server = FastAPI(lifespan=lifespan)
+
+    @server.get("/metrics", response_class=PlainTextResponse)
+    def metrics():
+        return render_metrics()
+
+    if BATCH_API_TOKEN:
+        @server.post("/api/batch")
+        async def batch(request: Request):
+            """JSONL 작업 목록(한 줄에 작업 하나, PDF는 pdf_base64)을 받아 결과를 JSONL로 스트리밍합니다."""
+            # 토큰 비교에 걸리는 시간으로 토큰을 추측할 수 없도록 상수 시간 비교를 사용합니다.
+            authorization = request.headers.get("authorization", "").encode("utf-8")
+            if not hmac.compare_digest(authorization, f"Bearer {BATCH_API_TOKEN}".encode("utf-8")):
+                raise HTTPException(status_code=401, detail="invalid token")
+            max_bytes = int(BATCH_MAX_BODY_MB * 1024 * 1024)
+            too_large = HTTPException(status_code=413, detail=f"request body exceeds {BATCH_MAX_BODY_MB:g}MB")
+            content_length = request.headers.get("content-length")
+            if content_length and content_length.isdigit() and int(content_length) > max_bytes:
+                raise too_large
+            # Content-Length가 없거나 틀려도 한도를 넘는 순간 읽기를 멈춥니다.
+            body = bytearray()
+            async for chunk in request.stream():
+                body += chunk
+                if len(body) > max_bytes:
+                    raise too_large
+            try:
+                body = body.decode("utf-8")
+            except UnicodeDecodeError as e:
+                raise HTTPException(status_code=400, detail=f"request body must be UTF-8: {e}")
+            try:
+                jobs = [json.loads(line) for line in body.splitlines() if line.strip()]
+            except json.JSONDecodeError as e:
+                raise HTTPException(status_code=400, detail=f"invalid JSONL: {e}")
+            lines = (json.dumps(result, ensure_ascii=False) + "\n" for result in run_uploaded_batch(jobs))
+            return StreamingResponse(lines, media_type="application/x-ndjson")
+
+    if not with_ui:
+        return server
+    # 너무 큰 업로드는 Gradio가 디스크에 쓰기 전에 거부합니다.
+    return gr.mount_gradio_app(server, demo, path="", max_file_size=int(UPLOAD_MAX_MB * 1024 * 1024))
+
+def create_headless_server_app():
+    """멀티 워커 모드의 각 워커가 사용하는 앱 팩토리입니다. Gradio UI 없이 /metrics와 /api/batch만 제공합니다."""
+    return create_server_app(with_ui=False)
+
 if __name__ == "__main__":
-    demo.launch(
-        server_name="0.0.0.0",
-        server_port=int(os.environ.get('PORT', 7860))
-    )
+    import sys
+    if "--check-startup" in sys.argv:
+        # 배포 전 콜드 스타트 예산 확인용: 서버 앱까지 구성한 뒤 보고서를 출력하고, 예산을 넘으면 실패로 종료합니다.
+        with startup_phase("create server app"):
+            create_server_app()
+        print(startup_report("time to ready"))
+        sys.exit(1 if STARTUP_BUDGET_SEC and startup_timings["time to ready"] > STARTUP_BUDGET_SEC else 0)
+
+    if UVICORN_WORKERS > 1:
+        # 멀티 워커 모드: 각 워커가 app 모듈을 불러와 create_headless_server_app()으로 앱을 만듭니다.
+        # Gradio 대기열(queue/join, queue/data)과 gr.State는 워커 프로세스별로 보관되는데, uvicorn 워커는 한 소켓을 나눠 받아
+        # 같은 세션의 요청이 다른 워커로 갈 수 있으므로 UI는 제공하지 않습니다. UI는 UVICORN_WORKERS=1 프로세스로 따로 실행하세요.
+        print(f"멀티 워커 모드: 워커 {UVICORN_WORKERS}개, 공유 상태 {SHARED_STATE_DB}")
+        print("주의: 멀티 워커 모드에서는 Gradio UI 없이 /api/batch와 /metrics만 제공합니다.")
+        if not BATCH_API_TOKEN:
+            print("경고: BATCH_API_TOKEN이 설정되지 않아 /api/batch가 비활성화되어 있습니다. /metrics만 제공합니다.")
+        # 이전 실행에서 남은 접속자와 호출 슬롯 기록은 새 워커를 띄우기 전에 지웁니다.
+        live_sessions.reset()
+        with connect_shared_db(SHARED_STATE_DB) as conn:
+            conn.execute("CREATE TABLE IF NOT EXISTS limiter_leases (lease TEXT PRIMARY KEY, model TEXT NOT NULL, expires REAL NOT NULL)")
+            conn.execute("DELETE FROM limiter_leases")
+        # 이 스크립트에서 uvicorn.run(workers=...)을 호출하면 워커마다 app.py를 __mp_main__과 app으로 두 번 불러오므로,
+        # uvicorn 명령으로 프로세스를 교체해 워커가 app 모듈만 한 번 불러오게 합니다.
+        # 다른 디렉터리에서 실행해도 app 모듈을 찾도록 이 파일의 디렉터리를 --app-dir로 넘깁니다.
+        os.execvp(sys.executable, [
+            sys.executable, "-m", "uvicorn", "app:create_headless_server_app", "--factory",
+            "--app-dir", os.path.dirname(os.path.abspath(__file__)),
+            "--workers", str(UVICORN_WORKERS),
+            "--host", "0.0.0.0",
+            "--port", str(int(os.environ.get('PORT', 7860))),
+        ])
+
+    import uvicorn
+
+    class _StartupReportingServer(uvicorn.Server):
+        """소켓을 열고 요청을 받기 시작한 시점에 "time to listening"을 기록하는 uvicorn 서버입니다."""
+        async def startup(self, sockets=None):
+            await super().startup(sockets=sockets)
+            if self.started:
+                print(startup_report("time to listening"))
+
+    _StartupReportingServer(uvicorn.Config(
+        create_server_app(),
+        host="0.0.0.0",
+        port=int(os.environ.get('PORT', 7860))
+    )).run()
@@ -0,0 +1,49 @@
+"""FastHire 배치 CLI
+
+JSONL 파일의 작업들(한 줄에 하나)을 병렬로 처리하고 결과를 JSONL로 출력합니다.
+같은 회사/직무의 작업은 1, 2단계(회사 정보, 면접관 페르소나) 결과를 공유합니다.
+
+작업 형식:
+    {"id": "c-001", "company": "네이버", "job": "백엔드 개발자", "pdf": "resumes/c-001.pdf",
+     "num_interviewers": 2, "questions_per_interviewer": 3, "lang": "ko"}
+
+사용 예:
+    python batch.py jobs.jsonl --workers 8 -o results.jsonl
+"""
+import argparse
+import json
+import sys
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="FastHire 면접 질문 배치 생성")
+    parser.add_argument("jobs", help="작업 JSONL 파일 경로 ('-'이면 표준 입력)")
+    parser.add_argument("-o", "--output", help="결과 JSONL 파일 경로 (기본값: 표준 출력)")
+    parser.add_argument("--workers", type=int, help="동시에 처리할 작업 수 (기본값: BATCH_WORKERS 환경 변수)")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    source = sys.stdin if args.jobs == "-" else open(args.jobs, encoding="utf-8")
+    with source:
+        jobs = [json.loads(line) for line in source if line.strip()]
+
+    import app
+    workers = args.workers or app.BATCH_WORKERS
+    output = open(args.output, "w", encoding="utf-8") if args.output else sys.stdout
+    failed = 0
+    try:
+        for result in app.run_batch(jobs, workers=workers):
+            failed += result["status"] != "ok"
+            output.write(json.dumps(result, ensure_ascii=False) + "\n")
+            output.flush()
+    finally:
+        if output is not sys.stdout:
+            output.close()
+    print(f"배치 완료: {len(jobs) - failed}/{len(jobs)}개 성공", file=sys.stderr)
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,220 @@
+"""FastHire 파이프라인 부하/벤치마크 스크립트
+
+로컬 mock LLM 백엔드로 generate_interview_questions를 여러 세션에서 동시에 실행하고
+종단 간 지연 시간(p50/p95/p99), 첫 출력까지의 시간, 단계별 소요 시간, 메모리(RSS)를 보고합니다.
+
+사용 예:
+    python bench.py --sessions 20 --rounds 3 --latency 0.5 --tokens-per-sec 80
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+from collections import defaultdict
+from types import SimpleNamespace
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="FastHire 파이프라인 벤치마크 (mock LLM 백엔드 사용)")
+    parser.add_argument("--sessions", type=int, default=10, help="동시에 실행할 가상 세션 수")
+    parser.add_argument("--rounds", type=int, default=1, help="세션마다 반복할 요청 수")
+    parser.add_argument("--latency", type=float, default=0.5, help="mock LLM의 첫 토큰까지 지연 시간(초)")
+    parser.add_argument("--tokens-per-sec", type=float, default=50.0, help="mock LLM의 초당 토큰 수")
+    parser.add_argument("--reply-tokens", type=int, default=200, help="mock LLM 응답 길이(토큰)")
+    parser.add_argument("--pdf", help="사용할 이력서 PDF 경로 (없으면 합성 PDF 생성)")
+    parser.add_argument("--lang", choices=["ko", "en"], default="ko")
+    parser.add_argument("--unique-inputs", action="store_true",
+                        help="세션마다 다른 회사명을 사용해 단계 결과 캐시 적중을 피합니다")
+    return parser.parse_args()
+
+
+# 합성 이력서 문장 재료. 페이지마다 다른 조합을 뽑아 실제 이력서처럼 반복이 적은 텍스트를 만듭니다.
+_SAMPLE_COMPANIES = ["Northwind Logistics", "Bluefin Payments", "Helio Health", "Crestline Retail",
+                     "Orbit Mobility", "Larkspur Analytics", "Summit Bank", "Tidewater Media"]
+_SAMPLE_ROLES = ["Backend Engineer", "Senior Software Engineer", "Platform Engineer",
+                 "Data Engineer", "Site Reliability Engineer", "Tech Lead"]
+_SAMPLE_SYSTEMS = ["order routing service", "settlement pipeline", "patient scheduling API",
+                   "inventory forecasting job", "fraud scoring service", "search indexing workers",
+                   "billing reconciliation system", "notification gateway", "feature store",
+                   "identity and access service", "CDC ingestion pipeline", "pricing engine"]
+_SAMPLE_STACKS = ["Python and FastAPI", "Go and gRPC", "Kotlin and Spring Boot", "Java and Kafka",
+                  "TypeScript and Node.js", "Rust and Tokio", "Scala and Spark", "Python and Celery"]
+_SAMPLE_STORES = ["PostgreSQL", "MySQL", "Redis", "DynamoDB", "Elasticsearch", "BigQuery",
+                  "ClickHouse", "MongoDB", "Cassandra"]
+_SAMPLE_RESULTS = ["cut p99 latency from {a} ms to {b} ms", "reduced cloud spend by {p} percent",
+                   "raised throughput to {n} requests per second", "brought error rate under 0.{p} percent",
+                   "shortened deploy time from {a} to {c} minutes", "removed {n} lines of dead code",
+                   "onboarded {c} new engineers", "migrated {n} customers without downtime"]
+_SAMPLE_ACTIONS = ["Designed", "Rebuilt", "Owned", "Scaled", "Introduced", "Led the migration of",
+                   "Profiled and tuned", "Split out", "Automated", "Hardened"]
+
+
+def _sample_resume_lines(rng: random.Random, page_index: int, line_count: int = 30) -> list:
+    """page_index 페이지에 들어갈 이력서 문장을 만듭니다. 같은 시드면 같은 내용이 나옵니다."""
+    lines = []
+    if page_index == 0:
+        lines += ["Jordan Lee - Backend Engineer", "jordan.lee@example.com / Seoul, Korea", "",
+                  "Summary", "Backend engineer with 8 years building payment and logistics systems.", ""]
+    while len(lines) < line_count:
+        start = rng.randint(2012, 2022)
+        lines.append(f"{rng.choice(_SAMPLE_ROLES)}, {rng.choice(_SAMPLE_COMPANIES)} ({start} - {start + rng.randint(1, 4)})")
+        for _ in range(rng.randint(3, 5)):
+            result = rng.choice(_SAMPLE_RESULTS).format(
+                a=rng.randint(200, 900), b=rng.randint(20, 180), c=rng.randint(2, 15),
+                p=rng.randint(5, 60), n=rng.randint(100, 20000))
+            lines.append(f"- {rng.choice(_SAMPLE_ACTIONS)} the {rng.choice(_SAMPLE_SYSTEMS)} on "
+                         f"{rng.choice(_SAMPLE_STACKS)} with {rng.choice(_SAMPLE_STORES)}; {result}.")
+        lines.append("")
+    return lines[:line_count]
+
+
+def _pdf_string(text: str) -> str:
+    """PDF 문자열 리터럴에서 특수 문자로 쓰이는 괄호와 역슬래시를 이스케이프합니다."""
+    return text.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+
+
+def write_sample_pdf(path: str, pages: int = 3, seed: int = 7):
+    """PyPDF2로 텍스트를 추출할 수 있는 여러 페이지 PDF를 만듭니다.
+    페이지마다 경력/프로젝트 문장이 다르게 조합되어 압축·추출 단계가 실제 이력서와 비슷한 일을 합니다."""
+    rng = random.Random(seed)
+    objects = [b"<< /Type /Catalog /Pages 2 0 R >>"]
+    kids = " ".join(f"{4 + 2 * i} 0 R" for i in range(pages))
+    objects.append(f"<< /Type /Pages /Kids [{kids}] /Count {pages} >>".encode())
+    objects.append(b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>")
+    for i in range(pages):
+        text = " ".join(f"({_pdf_string(line)}) '" for line in _sample_resume_lines(rng, i))
+        stream = f"BT /F1 10 Tf 40 770 Td 12 TL {text} ET"
+        objects.append(
+            f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] "
+            f"/Resources << /Font << /F1 3 0 R >> >> /Contents {5 + 2 * i} 0 R >>".encode()
+        )
+        objects.append(f"<< /Length {len(stream)} >>\nstream\n{stream}\nendstream".encode())
+    data = b"%PDF-1.4\n"
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(len(data))
+        data += f"{number} 0 obj\n".encode() + body + b"\nendobj\n"
+    xref = len(data)
+    data += f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n".encode()
+    data += b"".join(f"{offset:010d} 00000 n \n".encode() for offset in offsets)
+    data += f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n".encode()
+    with open(path, "wb") as file:
+        file.write(data)
+
+
+def current_rss_mb() -> float:
+    """현재 프로세스의 RSS(MB)를 반환합니다."""
+    try:
+        with open("/proc/self/status") as status:
+            for line in status:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    import resource
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def percentile(values: list, q: float) -> float:
+    if not values:
+        return float("nan")
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(q / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def main():
+    args = parse_args()
+    # app을 import하기 전에 mock 백엔드 설정을 적용해야 합니다.
+    os.environ["LLM_BACKEND"] = "mock"
+    os.environ["MOCK_LLM_LATENCY"] = str(args.latency)
+    os.environ["MOCK_LLM_TOKENS_PER_SEC"] = str(args.tokens_per_sec)
+    os.environ["MOCK_LLM_REPLY_TOKENS"] = str(args.reply_tokens)
+    # 저장된 실행 결과를 그대로 돌려주면 지연 시간이 측정되지 않으므로 체크포인트를 끕니다.
+    os.environ["CHECKPOINT_ENABLED"] = "0"
+    import app
+
+    pdf_path = args.pdf
+    if not pdf_path:
+        pdf_path = os.path.join(tempfile.mkdtemp(prefix="fasthire-bench-"), "resume.pdf")
+        write_sample_pdf(pdf_path)
+
+    stage_times = defaultdict(list)
+    stage_lock = threading.Lock()
+
+    def on_stage(stage_name, seconds, labels):
+        with stage_lock:
+            stage_times[stage_name].append(seconds)
+    app.stage_listeners.append(on_stage)
+
+    T = app.LANG_STRINGS[args.lang]
+    step3_marker = T['log_step3_start'] + "\n"
+    latencies, first_outputs, failures = [], [], []
+    results_lock = threading.Lock()
+    peak_rss = current_rss_mb()
+    sampler_stop = threading.Event()
+
+    def sample_rss():
+        # 세션이 끝날 때만 재면 요청 도중의 최대값을 놓치므로 주기적으로 샘플링합니다.
+        nonlocal peak_rss
+        while not sampler_stop.is_set():
+            peak_rss = max(peak_rss, current_rss_mb())
+            sampler_stop.wait(0.02)
+
+    def run_session(session_index):
+        for round_index in range(args.rounds):
+            company = f"벤치마크회사{session_index}" if args.unique_inputs else "벤치마크회사"
+            start = time.perf_counter()
+            first_output = None
+            output = ""
+            for output in app.generate_interview_questions(
+                company, "백엔드 개발자", SimpleNamespace(name=pdf_path), 2, 2, args.lang
+            ):
+                # 첫 출력: 3단계 시작 이후 모델이 생성한 텍스트가 처음 화면에 표시된 시점
+                if first_output is None and step3_marker in output and not output.endswith(step3_marker):
+                    first_output = time.perf_counter() - start
+            elapsed = time.perf_counter() - start
+            with results_lock:
+                if T['log_all_done'] in output:
+                    latencies.append(elapsed)
+                    if first_output is not None:
+                        first_outputs.append(first_output)
+                else:
+                    failures.append(output[-200:])
+
+    rss_before = current_rss_mb()
+    sampler = threading.Thread(target=sample_rss, daemon=True)
+    sampler.start()
+    threads = [threading.Thread(target=run_session, args=(i,)) for i in range(args.sessions)]
+    wall_start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    wall = time.perf_counter() - wall_start
+    sampler_stop.set()
+    sampler.join()
+
+    total = args.sessions * args.rounds
+    print(f"\n=== FastHire 벤치마크: 세션 {args.sessions}개 × {args.rounds}회, mock 지연 {args.latency}초, "
+          f"초당 {args.tokens_per_sec}토큰 ===")
+    print(f"성공 {len(latencies)}/{total}, 전체 {wall:.2f}초, 처리량 {len(latencies) / wall:.2f} req/s")
+    for name, values in (("종단 간 지연", latencies), ("첫 출력까지", first_outputs)):
+        print(f"{name:<10} p50={percentile(values, 50):.3f}s p95={percentile(values, 95):.3f}s "
+              f"p99={percentile(values, 99):.3f}s")
+    print("단계별 소요 시간:")
+    for stage_name, values in sorted(stage_times.items()):
+        print(f"  {stage_name:<10} n={len(values):<4} p50={percentile(values, 50):.3f}s "
+              f"p95={percentile(values, 95):.3f}s p99={percentile(values, 99):.3f}s")
+    print(f"RSS: 시작 {rss_before:.1f}MB, 최대 {peak_rss:.1f}MB")
+    print(f"단계 결과 캐시: {app.stage_cache.stats()}, PDF 캐시: {app.pdf_cache.stats()}")
+    if failures:
+        print(f"실패 예시: {failures[0]!r}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,7 @@
+import os
+import sys
+
+# app은 import 시점에 환경 변수를 읽으므로, 실제 API나 디스크 체크포인트를 쓰지 않도록 먼저 설정합니다.
+os.environ.setdefault("LLM_BACKEND", "mock")
+os.environ.setdefault("CHECKPOINT_ENABLED", "0")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,132 @@
+"""LLM 호출의 재시도, 대체 모델 전환, 헤징, 기한 처리를 가짜 클라이언트로 확인합니다.
+가짜 클라이언트는 응답 지연과 오류를 주입하며, app._llm_backend에 넣어 실제 API 대신 사용합니다."""
+import asyncio
+import threading
+import time
+from types import SimpleNamespace
+
+import pytest
+
+import app
+
+MODEL = app.MODELS["en"]
+FALLBACK = app.FALLBACK_MODELS[MODEL]
+
+
+class FakeAPIError(Exception):
+    def __init__(self, status_code: int):
+        super().__init__(f"HTTP {status_code}")
+        self.status_code = status_code
+
+
+def _response(text: str):
+    return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=text))], usage=None)
+
+
+class FakeClient:
+    """chat.completions.create만 흉내 냅니다. script(model, 호출 순번)가 (지연 초, 응답 텍스트 또는 예외)를 돌려줍니다."""
+
+    def __init__(self, script):
+        self.script = script
+        self.calls = []
+        self._lock = threading.Lock()
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self.create))
+
+    def create(self, model, messages, **kwargs):
+        with self._lock:
+            self.calls.append(model)
+            attempt = sum(1 for called in self.calls if called == model)
+        delay, outcome = self.script(model, attempt)
+        time.sleep(delay)
+        if isinstance(outcome, Exception):
+            raise outcome
+        return _response(outcome)
+
+
+class FakeAsyncClient(FakeClient):
+    """AsyncTogether와 같은 인터페이스의 가짜 클라이언트입니다. 진행 중인 요청 수를 기록합니다."""
+
+    def __init__(self, script):
+        super().__init__(script)
+        self.active = 0
+
+    async def create(self, model, messages, **kwargs):
+        with self._lock:
+            self.calls.append(model)
+            attempt = sum(1 for called in self.calls if called == model)
+        delay, outcome = self.script(model, attempt)
+        self.active += 1
+        try:
+            await asyncio.sleep(delay)
+        finally:
+            self.active -= 1
+        if isinstance(outcome, Exception):
+            raise outcome
+        return _response(outcome)
+
+
+@pytest.fixture
+def use_client(monkeypatch):
+    monkeypatch.setattr(app, "LLM_RETRY_BACKOFF", 0.01)
+    monkeypatch.setattr(app, "LLM_HEDGE_AFTER", 0)
+    monkeypatch.setattr(app, "_model_limiters", {})
+
+    def install(backend):
+        monkeypatch.setattr(app, "_llm_backend", backend)
+        return backend
+    return install
+
+
+def test_transient_error_is_retried(use_client):
+    client = FakeClient(lambda model, attempt: (0, FakeAPIError(503) if attempt == 1 else "ok"))
+    use_client(app.TogetherBackend(client))
+    assert app.call_llm("q", [], MODEL) == "ok"
+    assert client.calls == [MODEL, MODEL]
+
+
+def test_non_transient_error_is_not_retried(use_client):
+    client = FakeClient(lambda model, attempt: (0, FakeAPIError(400)))
+    use_client(app.TogetherBackend(client))
+    assert app.call_llm("q", [], MODEL).startswith("Error")
+    assert client.calls == [MODEL, FALLBACK]
+
+
+def test_falls_back_after_retries(use_client):
+    client = FakeClient(lambda model, attempt: (0, FakeAPIError(429) if model == MODEL else "fallback"))
+    use_client(app.TogetherBackend(client))
+    answered_by = []
+    assert app.call_llm("q", [], MODEL, on_model=answered_by.append) == "fallback"
+    assert client.calls == [MODEL] * (app.LLM_MAX_RETRIES + 1) + [FALLBACK]
+    assert answered_by == [FALLBACK]
+
+
+def test_hedged_request_wins(use_client, monkeypatch):
+    monkeypatch.setattr(app, "LLM_HEDGE_AFTER", 0.1)
+    client = FakeClient(lambda model, attempt: (1.0, "slow") if attempt == 1 else (0, "hedged"))
+    use_client(app.TogetherBackend(client))
+    start = time.monotonic()
+    assert app.call_llm("q", [], MODEL) == "hedged"
+    assert time.monotonic() - start < 0.8
+
+
+def test_losing_hedged_request_is_cancelled(use_client, monkeypatch):
+    monkeypatch.setattr(app, "LLM_HEDGE_AFTER", 0.1)
+    client = FakeAsyncClient(lambda model, attempt: (5.0, "slow") if attempt == 1 else (0, "hedged"))
+    use_client(app.AsyncTogetherBackend(client, pool_size=4))
+    assert app.call_llm("q", [], MODEL) == "hedged"
+    # 진 요청은 취소되어 연결과 호출 제한 슬롯을 곧 돌려줍니다.
+    limiter = app.get_model_limiter(MODEL)
+    end = time.monotonic() + 1
+    while (client.active or limiter.in_flight) and time.monotonic() < end:
+        time.sleep(0.02)
+    assert client.active == 0
+    assert limiter.in_flight == 0
+
+
+def test_deadline_bounds_slow_call(use_client):
+    client = FakeClient(lambda model, attempt: (2.0, "late"))
+    use_client(app.TogetherBackend(client))
+    start = time.monotonic()
+    reply = app.call_llm("q", [], MODEL, deadline=time.monotonic() + 0.3)
+    assert reply.startswith("Error") and "deadline" in reply
+    assert time.monotonic() - start < 1.0